@@ -18,6 +18,92 @@ class BrowserConfig(BaseModel):
     locale: str = "en-US"
     block_webrtc: bool = True
     geoip: bool = True
+    ready_strategy: str = ""  # dom_quiet, network_quiet, selector, text
+    ready_quiet: int = 500
+    ready_cap: int = 10000
+    script_step_timeout: int = 10000
+
+
+class CacheConfig(BaseModel):
+    enabled: bool = False
+    dir: str = "cache/resources"
+    max_size: int = 1024 * 1024 * 1024
+    max_object_size: int = 10 * 1024 * 1024
+    resource_types: list[str] = ["script", "stylesheet", "font", "image"]
+
+
+class FingerprintConfig(BaseModel):
+    ignore_selectors: list[str] = ["script", "style", "noscript", "template"]
+    shingle_size: int = 4
+    max_distance: int = 3  # simhash bits that may differ on an unchanged page
+
+
+class HttpConfig(BaseModel):
+    pool_size: int = 100
+    pool_size_per_host: int = 10
+    dns_cache_ttl: int = 300
+    max_redirects: int = 10
+    min_text_length: int = 200
+
+
+class ProxyConfig(BaseModel):
+    proxies: list[str] = []
+    strategy: str = "round_robin"  # round_robin, least_recently_used, sticky
+    max_attempts: int = 3
+    connect_timeout: int = 3000
+    check_interval: int = 30000
+    failure_threshold: int = 3
+    quarantine_time: int = 60000
+    latency_window: int = 50
+
+
+class SinkConfig(BaseModel):
+    dir: str = "results"
+    max_file_size: int = 256 * 1024 * 1024
+    batch_size: int = 100
+    flush_interval: int = 1000
+    dedupe_window: int = 10000  # recent bodies remembered for revisits
+
+
+class DashboardConfig(BaseModel):
+    history_size: int = 360
+    latency_window: int = 50
+    subscriber_queue: int = 256
+    keepalive: int = 15000
+
+
+class DiagnosticsConfig(BaseModel):
+    lag_interval: int = 500
+    lag_window: int = 120
+    stall_threshold: int = 200  # loop blocked this long gets its stack logged
+    stall_history: int = 20
+    profile_duration: int = 10000
+    profile_max_duration: int = 60000
+    profile_interval: int = 5
+
+
+class DispatchConfig(BaseModel):
+    hedging: bool = False
+    hedge_percentile: float = 95.0
+    hedge_min_delay: int = 1000
+    hedge_budget: float = 0.1
+    hedge_burst: int = 10
+    latency_window: int = 200
+    min_samples: int = 20
+    retry_attempts: int = 2
+    deadline_margin: int = 30000
+
+
+class LimiterConfig(BaseModel):
+    adaptive: bool = True
+    initial_limit: int = 0  # 0 starts at browser.max_pages
+    max_limit: int = 20  # how far the limit may grow past max_pages
+    min_limit: int = 1
+    window: int = 50
+    latency_tolerance: float = 2.0  # times the baseline render latency
+    backoff: float = 0.7
+    cpu_threshold: float = 90.0
+    memory_threshold: float = 90.0
 
 
 class LoggingConfig(BaseModel):
@@ -32,11 +118,41 @@ class LoggingConfig(BaseModel):
     sink: str = "logs/app.log"
 
 
+class RegistryConfig(BaseModel):
+    monitor_interval: int = 5000
+    heartbeat_timeout: int = 30000
+    evict_after: int = 4  # heartbeat timeouts before a silent worker is dropped
+    breaker_window: int = 20
+    breaker_min_requests: int = 5
+    breaker_error_rate: float = 0.5
+    breaker_cooldown: int = 30000
+    drain_timeout: int = 60000
+    restart_floor: int = 0  # 0 keeps the whole fleet serving on restart
+
+
+class SpawnConfig(BaseModel):
+    zygote: bool = False
+    standby_browsers: int = 0
+    browser_launch_timeout: int = 60000
+    register_timeout: int = 30000
+
+
 class ServerConfig(BaseModel):
     host: str = "0.0.0.0"
     port: int = 8000
 
     manager_address: str = "localhost:50050"
+    max_message_size: int = 64 * 1024 * 1024
+    shutdown_grace: int = 30000
+
+
+class TransportConfig(BaseModel):
+    unix_sockets: bool = False
+    socket_dir: str = "/tmp/aranea"
+    shared_memory: bool = False
+    shm_dir: str = "/dev/shm/aranea"
+    shm_threshold: int = 1024 * 1024
+    shm_ttl: int = 60000
 
 
 class Settings(BaseSettings):
@@ -44,7 +160,19 @@ class Settings(BaseSettings):
 
     browser: BrowserConfig = Field(default_factory=BrowserConfig)
     logging: LoggingConfig = Field(default_factory=LoggingConfig)
+    cache: CacheConfig = Field(default_factory=CacheConfig)
+    dashboard: DashboardConfig = Field(default_factory=DashboardConfig)
+    diagnostics: DiagnosticsConfig = Field(default_factory=DiagnosticsConfig)
+    dispatch: DispatchConfig = Field(default_factory=DispatchConfig)
+    fingerprint: FingerprintConfig = Field(default_factory=FingerprintConfig)
+    http: HttpConfig = Field(default_factory=HttpConfig)
+    limiter: LimiterConfig = Field(default_factory=LimiterConfig)
+    proxy: ProxyConfig = Field(default_factory=ProxyConfig)
+    registry: RegistryConfig = Field(default_factory=RegistryConfig)
     server: ServerConfig = Field(default_factory=ServerConfig)
+    sink: SinkConfig = Field(default_factory=SinkConfig)
+    spawn: SpawnConfig = Field(default_factory=SpawnConfig)
+    transport: TransportConfig = Field(default_factory=TransportConfig)
 
     @classmethod
     def settings_customise_sources(
@@ -62,3 +190,10 @@ class Settings(BaseSettings):
 
 
 settings = Settings()
+
+
+def grpc_options() -> list[tuple[str, int]]:
+    return [
+        ("grpc.max_send_message_length", settings.server.max_message_size),
+        ("grpc.max_receive_message_length", settings.server.max_message_size),
+    ]
@@ -0,0 +1,145 @@
+import asyncio
+import io
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from typing import Optional
+
+from app.config import settings
+from app.logger import log
+
+ACTIONS = ("tasks", "profile")
+
+
+# Measures how late the event loop wakes up from a sleep, and watches it
+# from a thread so the stack of a callback that blocks the loop can be
+# captured while it is still running
+class LoopMonitor:
+    def __init__(
+        self,
+        interval: int = settings.diagnostics.lag_interval,
+        threshold: int = settings.diagnostics.stall_threshold,
+    ) -> None:
+        self.interval = interval / 1000
+        self.threshold = threshold / 1000
+        self.lags = deque(maxlen=settings.diagnostics.lag_window)
+        self.stalls = deque(maxlen=settings.diagnostics.stall_history)
+
+        self._beat = time.monotonic()
+        self._loop_thread: Optional[int] = None
+        self._task = None
+        self._stopped = threading.Event()
+
+    @property
+    def lag(self) -> float:
+        return self.lags[-1] if self.lags else 0.0
+
+    @property
+    def max_lag(self) -> float:
+        return max(self.lags, default=0.0)
+
+    def start(self) -> None:
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.create_task(self._measure())
+        threading.Thread(
+            target=self._watch, name="loop-watchdog", daemon=True
+        ).start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _measure(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(loop.time() - expected, 0.0))
+            self._beat = time.monotonic()
+
+    def _watch(self) -> None:
+        reported = None
+        while not self._stopped.wait(min(self.interval, self.threshold) / 2):
+            beat = self._beat
+            blocked = time.monotonic() - beat - self.interval
+            if blocked < self.threshold or beat == reported:
+                continue
+
+            # One stack per stall, taken while the loop is still stuck
+            reported = beat
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame else ""
+            self.stalls.append(
+                {"time": time.time(), "blocked": blocked, "stack": stack}
+            )
+            log.warning(
+                f"Event loop blocked for over {blocked:.2f}s at:\n{stack}"
+            )
+
+    def describe(self) -> dict:
+        return {
+            "lag": self.lag,
+            "max_lag": self.max_lag,
+            "stalls": list(self.stalls),
+        }
+
+
+def dump_tasks() -> str:
+    out = io.StringIO()
+    tasks = asyncio.all_tasks()
+    out.write(f"{len(tasks)} tasks\n\n")
+    for task in tasks:
+        task.print_stack(file=out)
+        out.write("\n")
+    return out.getvalue()
+
+
+# Samples the stacks of all threads and returns them in the folded
+# format flamegraph.pl and speedscope read
+def _sample(duration: float, interval: float) -> str:
+    me = threading.get_ident()
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    counts = Counter()
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({code.co_filename}:"
+                    f"{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            counts[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return "".join(f"{stack} {count}\n" for stack, count in counts.items())
+
+
+async def profile(duration: Optional[int] = None) -> str:
+    duration = min(
+        duration or settings.diagnostics.profile_duration,
+        settings.diagnostics.profile_max_duration,
+    )
+    return await asyncio.to_thread(
+        _sample, duration / 1000, settings.diagnostics.profile_interval / 1000
+    )
+
+
+async def diagnose(action: str, duration: Optional[int] = None) -> str:
+    if action == "tasks":
+        return dump_tasks()
+    if action == "profile":
+        return await profile(duration)
+    raise ValueError(f"Unknown diagnostics action: {action}")
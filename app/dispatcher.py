@@ -0,0 +1,241 @@
+import asyncio
+from collections import defaultdict, deque
+from typing import Optional
+from urllib.parse import urlsplit
+
+import grpc
+
+import app.generated.parse_pb2 as parse_pb2
+
+from app.config import settings
+from app.logger import log
+from app.registry import WorkerRegistry
+from app.transport import read_shared
+
+# Statuses the worker uses to report a failed render
+FAILED_STATUSES = (418, 518)
+
+# Parse is read-only, so these are safe to retry on another worker
+RETRYABLE_CODES = (
+    grpc.StatusCode.UNAVAILABLE,
+    grpc.StatusCode.ABORTED,
+    grpc.StatusCode.RESOURCE_EXHAUSTED,
+)
+
+# Details a worker sends with UNAVAILABLE while it drains
+DRAINING_DETAILS = "Worker is draining"
+
+# Codes that say the worker itself is unwell: it can't be reached, hung,
+# or reported that its browser is gone. Anything a worker answers with a
+# status is about the page or the request and says nothing of its health
+UNHEALTHY_CODES = (
+    grpc.StatusCode.UNAVAILABLE,
+    grpc.StatusCode.DEADLINE_EXCEEDED,
+    grpc.StatusCode.INTERNAL,
+)
+
+
+class LatencyTracker:
+    def __init__(self, window: int = settings.dispatch.latency_window):
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+
+    def record(self, key: str, latency: float) -> None:
+        self._samples[key].append(latency)
+
+    def percentile(self, key: str, q: float) -> Optional[float]:
+        samples = self._samples.get(key)
+        if not samples or len(samples) < settings.dispatch.min_samples:
+            return None
+        ordered = sorted(samples)
+        index = min(int(len(ordered) * q / 100), len(ordered) - 1)
+        return ordered[index]
+
+
+class HedgeBudget:
+    # Token bucket: every request earns `ratio` tokens and a hedge costs
+    # one, so hedging never adds more than `ratio` of extra load
+    def __init__(
+        self,
+        ratio: float = settings.dispatch.hedge_budget,
+        burst: int = settings.dispatch.hedge_burst,
+    ):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = float(burst)
+
+    def earn(self) -> None:
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def spend(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class Dispatcher:
+    def __init__(self, worker_registry: WorkerRegistry):
+        self.worker_registry = worker_registry
+        self.latency = LatencyTracker()
+        self.budget = HedgeBudget()
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def _hedge_delay(self, domain: str) -> Optional[float]:
+        if not settings.dispatch.hedging:
+            return None
+        percentile = self.latency.percentile(
+            domain, settings.dispatch.hedge_percentile
+        )
+        if percentile is None:
+            return None
+        return max(percentile, settings.dispatch.hedge_min_delay / 1000)
+
+    async def parse(
+        self, request: parse_pb2.ParseRequest
+    ) -> parse_pb2.ParseResponse:
+        loop = asyncio.get_running_loop()
+        timeout = request.timeout or settings.browser.timeout
+        deadline = (
+            loop.time() + (timeout + settings.dispatch.deadline_margin) / 1000
+        )
+        self.budget.earn()
+
+        tried = []
+        for attempt in range(settings.dispatch.retry_attempts + 1):
+            try:
+                response = await self._dispatch(request, deadline, tried)
+                if response.shared:
+                    response = await self._read_shared(request, response)
+                return response
+            except grpc.aio.AioRpcError as e:
+                if (
+                    e.code() not in RETRYABLE_CODES
+                    or attempt == settings.dispatch.retry_attempts
+                    or loop.time() >= deadline
+                ):
+                    raise
+                log.warning(
+                    f"Parse of {request.url} failed on {tried[-1]} "
+                    f"({e.code().name}), retrying on another worker"
+                )
+
+    async def _read_shared(self, request, response):
+        try:
+            return await asyncio.to_thread(read_shared, response)
+        except Exception as e:
+            log.error(f"Failed to read shared payload of {request.url}: {e}")
+            return parse_pb2.ParseResponse(
+                status=518,
+                error=f"Failed to read shared payload: {e}",
+                url=request.url,
+            )
+
+    async def _dispatch(self, request, deadline, tried):
+        loop = asyncio.get_running_loop()
+        domain = urlsplit(request.url).hostname or ""
+        started = loop.time()
+
+        worker_id, stub = await self.worker_registry.get_available_worker(
+            exclude=tried
+        )
+        tried.append(worker_id)
+        log.info(f"Sending parse request to worker {worker_id}")
+        primary = asyncio.create_task(
+            self._call(worker_id, stub, request, deadline)
+        )
+        tasks = {primary: worker_id}
+
+        try:
+            delay = (
+                self._hedge_delay(domain) if self._hedgeable(request) else None
+            )
+            if delay is not None:
+                await asyncio.wait({primary}, timeout=delay)
+                if not primary.done() and self.budget.spend():
+                    await self._hedge(request, tasks, tried, deadline)
+
+            winner, response = await self._first_success(tasks)
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+        if response.status not in FAILED_STATUSES:
+            self.latency.record(domain, loop.time() - started)
+            if winner is not primary:
+                self.hedge_wins += 1
+        return response
+
+    async def _call(self, worker_id, stub, request, deadline):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        timeout = deadline - started
+        try:
+            response = await stub.Parse(request, timeout=max(timeout, 0))
+        except grpc.aio.AioRpcError as e:
+            # A worker at its page limit or draining is healthy, it just
+            # can't take this request
+            if (
+                e.code() == grpc.StatusCode.UNAVAILABLE
+                and e.details() == DRAINING_DETAILS
+            ):
+                self.worker_registry.mark_draining(worker_id)
+            elif e.code() in UNHEALTHY_CODES:
+                await self.worker_registry.record_result(worker_id, False)
+            raise
+        # A failed render (418/518) is the site's or the request's fault,
+        # a broken browser comes back as UNAVAILABLE instead
+        await self.worker_registry.record_result(
+            worker_id, True, loop.time() - started
+        )
+        return response
+
+    # A hedged request runs twice, which is only harmless for plain
+    # fetches and renders: sinks would get two records and actions or
+    # scripts would click and fill twice
+    def _hedgeable(self, request):
+        return not (request.sink or request.actions or request.script)
+
+    async def _hedge(self, request, tasks, tried, deadline):
+        try:
+            hedge_id, hedge_stub = (
+                await self.worker_registry.get_available_worker(
+                    exclude=tried
+                )
+            )
+        except RuntimeError:
+            return
+
+        log.info(
+            f"Hedging request for {request.url} on worker {hedge_id} "
+            f"after {tried[-1]} exceeded "
+            f"p{settings.dispatch.hedge_percentile}"
+        )
+        tried.append(hedge_id)
+        self.hedged += 1
+        task = asyncio.create_task(
+            self._call(hedge_id, hedge_stub, request, deadline)
+        )
+        tasks[task] = hedge_id
+
+    async def _first_success(self, tasks):
+        pending = set(tasks)
+        fallback = None
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception():
+                    error = task.exception()
+                    continue
+                response = task.result()
+                if response.status not in FAILED_STATUSES:
+                    return task, response
+                fallback = (task, response)
+
+        if fallback:
+            return fallback
+        raise error
@@ -24,7 +24,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0bparse.proto\x12\x06parser\"C\n\x12WorkerRegistration\x12\x11\n\tworker_id\x18\x01 \x01(\t\x12\x0c\n\x04host\x18\x02 \x01(\t\x12\x0c\n\x04port\x18\x03 \x01(\x05\"8\n\x14RegistrationResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\"\x99\x01\n\x0cStatusReport\x12\x11\n\tworker_id\x18\x01 \x01(\t\x12\x0c\n\x04port\x18\x02 \x01(\x05\x12)\n\x06status\x18\x03 \x01(\x0e\x32\x19.parser.HealthCheckStatus\x12\x14\n\x0c\x61\x63tive_pages\x18\x04 \x01(\x05\x12\x11\n\tcpu_usage\x18\x05 \x01(\x01\x12\x14\n\x0cmemory_usage\x18\x06 \x01(\x01\".\n\tStatusAck\x12\x10\n\x08received\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\"l\n\x0e\x41\x63tionArgument\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\x16\n\x0cstring_value\x18\x02 \x01(\tH\x00\x12\x13\n\tint_value\x18\x03 \x01(\x05H\x00\x12\x16\n\x0c\x64ouble_value\x18\x04 \x01(\x01H\x00\x42\x07\n\x05value\"<\n\x06\x41\x63tion\x12\x0c\n\x04\x66unc\x18\x01 \x01(\t\x12$\n\x04\x61rgs\x18\x02 \x03(\x0b\x32\x16.parser.ActionArgument\"\xdd\x01\n\x0cParseRequest\x12\x0b\n\x03url\x18\x01 \x01(\t\x12\r\n\x05proxy\x18\x02 \x01(\t\x12\x0f\n\x07timeout\x18\x03 \x01(\x05\x12\x1f\n\x07\x61\x63tions\x18\x04 \x03(\x0b\x32\x0e.parser.Action\x12\x32\n\x07headers\x18\x05 \x03(\x0b\x32!.parser.ParseRequest.HeadersEntry\x12\x0c\n\x04load\x18\x07 \x01(\t\x12\r\n\x05\x62lock\x18\x08 \x03(\t\x1a.\n\x0cHeadersEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\"\xd2\x01\n\rParseResponse\x12\x0e\n\x06status\x18\x01 \x01(\x05\x12\x0f\n\x07\x63ontent\x18\x02 \x01(\t\x12\r\n\x05\x65rror\x18\x03 \x01(\t\x12\x33\n\x07headers\x18\x04 \x03(\x0b\x32\".parser.ParseResponse.HeadersEntry\x12\x1f\n\x07\x63ookies\x18\x05 \x03(\x0b\x32\x0e.parser.Cookie\x12\x0b\n\x03url\x18\x06 \x01(\t\x1a.\n\x0cHeadersEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\"\x8a\x01\n\x06\x43ookie\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t\x12\x0e\n\x06\x64omain\x18\x03 \x01(\t\x12\x0c\n\x04path\x18\x04 \x01(\t\x12\x0f\n\x07\x65xpires\x18\x05 \x01(\x03\x12\x11\n\thttp_only\x18\x06 \x01(\x08\x12\x0e\n\x06secure\x18\x07 \x01(\x08\x12\x11\n\tsame_site\x18\x08 \x01(\t*?\n\x11HealthCheckStatus\x12\x06\n\x02OK\x10\x00\x12\n\n\x06NOT_OK\x10\x01\x12\x0b\n\x07UNKNOWN\x10\x02\x12\t\n\x05\x45RROR\x10\x03\x32\x44\n\x0cParserWorker\x12\x34\n\x05Parse\x12\x14.parser.ParseRequest\x1a\x15.parser.ParseResponse2\x94\x01\n\rParserManager\x12J\n\x0eRegisterWorker\x12\x1a.parser.WorkerRegistration\x1a\x1c.parser.RegistrationResponse\x12\x37\n\x0cReportStatus\x12\x14.parser.StatusReport\x1a\x11.parser.StatusAckb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0bparse.proto\x12\x06parser\"\x87\x01\n\x12WorkerRegistration\x12\x11\n\tworker_id\x18\x01 \x01(\t\x12\x0c\n\x04host\x18\x02 \x01(\t\x12\x0c\n\x04port\x18\x03 \x01(\x05\x12\x14\n\x0cstartup_time\x18\x04 \x01(\x01\x12\x1b\n\x13\x62rowser_launch_time\x18\x05 \x01(\x01\x12\x0f\n\x07\x61\x64\x64ress\x18\x06 \x01(\t\"8\n\x14RegistrationResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\"\xe9\x01\n\x0cStatusReport\x12\x11\n\tworker_id\x18\x01 \x01(\t\x12\x0c\n\x04port\x18\x02 \x01(\x05\x12)\n\x06status\x18\x03 \x01(\x0e\x32\x19.parser.HealthCheckStatus\x12\x14\n\x0c\x61\x63tive_pages\x18\x04 \x01(\x05\x12\x11\n\tcpu_usage\x18\x05 \x01(\x01\x12\x14\n\x0cmemory_usage\x18\x06 \x01(\x01\x12\x12\n\ncache_hits\x18\x07 \x01(\x03\x12\x14\n\x0c\x63\x61\x63he_misses\x18\x08 \x01(\x03\x12\x12\n\npage_limit\x18\t \x01(\x05\x12\x10\n\x08loop_lag\x18\n \x01(\x01\".\n\tStatusAck\x12\x10\n\x08received\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\"l\n\x0e\x41\x63tionArgument\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\x16\n\x0cstring_value\x18\x02 \x01(\tH\x00\x12\x13\n\tint_value\x18\x03 \x01(\x05H\x00\x12\x16\n\x0c\x64ouble_value\x18\x04 \x01(\x01H\x00\x42\x07\n\x05value\"<\n\x06\x41\x63tion\x12\x0c\n\x04\x66unc\x18\x01 \x01(\t\x12$\n\x04\x61rgs\x18\x02 \x03(\x0b\x32\x16.parser.ActionArgument\"o\n\tReadiness\x12\x10\n\x08strategy\x18\x01 \x01(\t\x12\x10\n\x08selector\x18\x02 \x01(\t\x12\x0c\n\x04text\x18\x03 \x01(\t\x12\x14\n\x0cignore_hosts\x18\x04 \x03(\t\x12\r\n\x05quiet\x18\x05 \x01(\x05\x12\x0b\n\x03\x63\x61p\x18\x06 \x01(\x05\"G\n\nStepTiming\x12\x0c\n\x04path\x18\x01 \x01(\t\x12\n\n\x02op\x18\x02 \x01(\t\x12\x10\n\x08\x64uration\x18\x03 \x01(\x01\x12\r\n\x05\x65rror\x18\x04 \x01(\t\"^\n\tArtifacts\x12\x12\n\nscreenshot\x18\x01 \x01(\x08\x12\x11\n\tfull_page\x18\x02 \x01(\x08\x12\x10\n\x08selector\x18\x03 \x01(\t\x12\x0b\n\x03pdf\x18\x04 \x01(\x08\x12\x0b\n\x03har\x18\x05 \x01(\x08\",\n\x0b\x46ingerprint\x12\x0c\n\x04hash\x18\x01 \x01(\t\x12\x0f\n\x07simhash\x18\x02 \x01(\x04\"<\n\rSharedPayload\x12\r\n\x05\x66ield\x18\x01 \x01(\t\x12\x0c\n\x04path\x18\x02 \x01(\t\x12\x0e\n\x06length\x18\x03 \x01(\x03\"[\n\rSinkReference\x12\x0c\n\x04sink\x18\x01 \x01(\t\x12\x0c\n\x04path\x18\x02 \x01(\t\x12\x0e\n\x06offset\x18\x03 \x01(\x03\x12\x0e\n\x06length\x18\x04 \x01(\x03\x12\x0e\n\x06sha256\x18\x05 \x01(\t\"\xbf\x03\n\x0cParseRequest\x12\x0b\n\x03url\x18\x01 \x01(\t\x12\r\n\x05proxy\x18\x02 \x01(\t\x12\x0f\n\x07timeout\x18\x03 \x01(\x05\x12\x1f\n\x07\x61\x63tions\x18\x04 \x03(\x0b\x32\x0e.parser.Action\x12\x32\n\x07headers\x18\x05 \x03(\x0b\x32!.parser.ParseRequest.HeadersEntry\x12\x0c\n\x04load\x18\x07 \x01(\t\x12\r\n\x05\x62lock\x18\x08 \x03(\t\x12\x0f\n\x07session\x18\t \x01(\t\x12\x0c\n\x04mode\x18\n \x01(\t\x12 \n\x05ready\x18\x0b \x01(\x0b\x32\x11.parser.Readiness\x12\x0e\n\x06script\x18\x0c \x01(\t\x12$\n\tartifacts\x18\r \x01(\x0b\x32\x11.parser.Artifacts\x12\x0c\n\x04sink\x18\x0e \x01(\t\x12\x13\n\x0b\x66ingerprint\x18\x0f \x01(\x08\x12%\n\x08previous\x18\x10 \x01(\x0b\x32\x13.parser.Fingerprint\x12\x0f\n\x07simhash\x18\x11 \x01(\x08\x12\x0e\n\x06ignore\x18\x12 \x03(\t\x1a.\n\x0cHeadersEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\"\xdb\x03\n\rParseResponse\x12\x0e\n\x06status\x18\x01 \x01(\x05\x12\x0f\n\x07\x63ontent\x18\x02 \x01(\t\x12\r\n\x05\x65rror\x18\x03 \x01(\t\x12\x33\n\x07headers\x18\x04 \x03(\x0b\x32\".parser.ParseResponse.HeadersEntry\x12\x1f\n\x07\x63ookies\x18\x05 \x03(\x0b\x32\x0e.parser.Cookie\x12\x0b\n\x03url\x18\x06 \x01(\t\x12\x0f\n\x07partial\x18\x07 \x01(\x08\x12#\n\x07timings\x18\x08 \x03(\x0b\x32\x12.parser.StepTiming\x12\x15\n\rscript_result\x18\t \x01(\t\x12\x12\n\nscreenshot\x18\n \x01(\x0c\x12\x0b\n\x03pdf\x18\x0b \x01(\x0c\x12\x0b\n\x03har\x18\x0c \x01(\x0c\x12(\n\treference\x18\r \x01(\x0b\x32\x15.parser.SinkReference\x12(\n\x0b\x66ingerprint\x18\x0e \x01(\x0b\x32\x13.parser.Fingerprint\x12\x11\n\tunchanged\x18\x0f \x01(\x08\x12%\n\x06shared\x18\x10 \x03(\x0b\x32\x15.parser.SharedPayload\x1a.\n\x0cHeadersEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\"\x1f\n\x0c\x44rainRequest\x12\x0f\n\x07timeout\x18\x01 \x01(\x05\"3\n\rDrainResponse\x12\x0f\n\x07\x64rained\x18\x01 \x01(\x08\x12\x11\n\tin_flight\x18\x02 \x01(\x05\"3\n\x0f\x44iagnoseRequest\x12\x0e\n\x06\x61\x63tion\x18\x01 \x01(\t\x12\x10\n\x08\x64uration\x18\x02 \x01(\x05\" \n\x10\x44iagnoseResponse\x12\x0c\n\x04\x64\x61ta\x18\x01 \x01(\x0c\"\x8a\x01\n\x06\x43ookie\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t\x12\x0e\n\x06\x64omain\x18\x03 \x01(\t\x12\x0c\n\x04path\x18\x04 \x01(\t\x12\x0f\n\x07\x65xpires\x18\x05 \x01(\x03\x12\x11\n\thttp_only\x18\x06 \x01(\x08\x12\x0e\n\x06secure\x18\x07 \x01(\x08\x12\x11\n\tsame_site\x18\x08 \x01(\t*?\n\x11HealthCheckStatus\x12\x06\n\x02OK\x10\x00\x12\n\n\x06NOT_OK\x10\x01\x12\x0b\n\x07UNKNOWN\x10\x02\x12\t\n\x05\x45RROR\x10\x03\x32\xb9\x01\n\x0cParserWorker\x12\x34\n\x05Parse\x12\x14.parser.ParseRequest\x1a\x15.parser.ParseResponse\x12\x34\n\x05\x44rain\x12\x14.parser.DrainRequest\x1a\x15.parser.DrainResponse\x12=\n\x08\x44iagnose\x12\x17.parser.DiagnoseRequest\x1a\x18.parser.DiagnoseResponse2\x94\x01\n\rParserManager\x12J\n\x0eRegisterWorker\x12\x1a.parser.WorkerRegistration\x1a\x1c.parser.RegistrationResponse\x12\x37\n\x0cReportStatus\x12\x14.parser.StatusReport\x1a\x11.parser.StatusAckb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -35,32 +35,52 @@ if not _descriptor._USE_C_DESCRIPTORS:
   _globals['_PARSEREQUEST_HEADERSENTRY']._serialized_options = b'8\001'
   _globals['_PARSERESPONSE_HEADERSENTRY']._loaded_options = None
   _globals['_PARSERESPONSE_HEADERSENTRY']._serialized_options = b'8\001'
-  _globals['_HEALTHCHECKSTATUS']._serialized_start=1104
-  _globals['_HEALTHCHECKSTATUS']._serialized_end=1167
-  _globals['_WORKERREGISTRATION']._serialized_start=23
-  _globals['_WORKERREGISTRATION']._serialized_end=90
-  _globals['_REGISTRATIONRESPONSE']._serialized_start=92
-  _globals['_REGISTRATIONRESPONSE']._serialized_end=148
-  _globals['_STATUSREPORT']._serialized_start=151
-  _globals['_STATUSREPORT']._serialized_end=304
-  _globals['_STATUSACK']._serialized_start=306
-  _globals['_STATUSACK']._serialized_end=352
-  _globals['_ACTIONARGUMENT']._serialized_start=354
-  _globals['_ACTIONARGUMENT']._serialized_end=462
-  _globals['_ACTION']._serialized_start=464
-  _globals['_ACTION']._serialized_end=524
-  _globals['_PARSEREQUEST']._serialized_start=527
-  _globals['_PARSEREQUEST']._serialized_end=748
-  _globals['_PARSEREQUEST_HEADERSENTRY']._serialized_start=702
-  _globals['_PARSEREQUEST_HEADERSENTRY']._serialized_end=748
-  _globals['_PARSERESPONSE']._serialized_start=751
-  _globals['_PARSERESPONSE']._serialized_end=961
-  _globals['_PARSERESPONSE_HEADERSENTRY']._serialized_start=702
-  _globals['_PARSERESPONSE_HEADERSENTRY']._serialized_end=748
-  _globals['_COOKIE']._serialized_start=964
-  _globals['_COOKIE']._serialized_end=1102
-  _globals['_PARSERWORKER']._serialized_start=1169
-  _globals['_PARSERWORKER']._serialized_end=1237
-  _globals['_PARSERMANAGER']._serialized_start=1240
-  _globals['_PARSERMANAGER']._serialized_end=1388
+  _globals['_HEALTHCHECKSTATUS']._serialized_start=2400
+  _globals['_HEALTHCHECKSTATUS']._serialized_end=2463
+  _globals['_WORKERREGISTRATION']._serialized_start=24
+  _globals['_WORKERREGISTRATION']._serialized_end=159
+  _globals['_REGISTRATIONRESPONSE']._serialized_start=161
+  _globals['_REGISTRATIONRESPONSE']._serialized_end=217
+  _globals['_STATUSREPORT']._serialized_start=220
+  _globals['_STATUSREPORT']._serialized_end=453
+  _globals['_STATUSACK']._serialized_start=455
+  _globals['_STATUSACK']._serialized_end=501
+  _globals['_ACTIONARGUMENT']._serialized_start=503
+  _globals['_ACTIONARGUMENT']._serialized_end=611
+  _globals['_ACTION']._serialized_start=613
+  _globals['_ACTION']._serialized_end=673
+  _globals['_READINESS']._serialized_start=675
+  _globals['_READINESS']._serialized_end=786
+  _globals['_STEPTIMING']._serialized_start=788
+  _globals['_STEPTIMING']._serialized_end=859
+  _globals['_ARTIFACTS']._serialized_start=861
+  _globals['_ARTIFACTS']._serialized_end=955
+  _globals['_FINGERPRINT']._serialized_start=957
+  _globals['_FINGERPRINT']._serialized_end=1001
+  _globals['_SHAREDPAYLOAD']._serialized_start=1003
+  _globals['_SHAREDPAYLOAD']._serialized_end=1063
+  _globals['_SINKREFERENCE']._serialized_start=1065
+  _globals['_SINKREFERENCE']._serialized_end=1156
+  _globals['_PARSEREQUEST']._serialized_start=1159
+  _globals['_PARSEREQUEST']._serialized_end=1606
+  _globals['_PARSEREQUEST_HEADERSENTRY']._serialized_start=1560
+  _globals['_PARSEREQUEST_HEADERSENTRY']._serialized_end=1606
+  _globals['_PARSERESPONSE']._serialized_start=1609
+  _globals['_PARSERESPONSE']._serialized_end=2084
+  _globals['_PARSERESPONSE_HEADERSENTRY']._serialized_start=1560
+  _globals['_PARSERESPONSE_HEADERSENTRY']._serialized_end=1606
+  _globals['_DRAINREQUEST']._serialized_start=2086
+  _globals['_DRAINREQUEST']._serialized_end=2117
+  _globals['_DRAINRESPONSE']._serialized_start=2119
+  _globals['_DRAINRESPONSE']._serialized_end=2170
+  _globals['_DIAGNOSEREQUEST']._serialized_start=2172
+  _globals['_DIAGNOSEREQUEST']._serialized_end=2223
+  _globals['_DIAGNOSERESPONSE']._serialized_start=2225
+  _globals['_DIAGNOSERESPONSE']._serialized_end=2257
+  _globals['_COOKIE']._serialized_start=2260
+  _globals['_COOKIE']._serialized_end=2398
+  _globals['_PARSERWORKER']._serialized_start=2466
+  _globals['_PARSERWORKER']._serialized_end=2651
+  _globals['_PARSERMANAGER']._serialized_start=2654
+  _globals['_PARSERMANAGER']._serialized_end=2802
 # @@protoc_insertion_point(module_scope)
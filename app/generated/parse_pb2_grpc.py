@@ -39,6 +39,16 @@ class ParserWorkerStub(object):
                 request_serializer=parse__pb2.ParseRequest.SerializeToString,
                 response_deserializer=parse__pb2.ParseResponse.FromString,
                 _registered_method=True)
+        self.Drain = channel.unary_unary(
+                '/parser.ParserWorker/Drain',
+                request_serializer=parse__pb2.DrainRequest.SerializeToString,
+                response_deserializer=parse__pb2.DrainResponse.FromString,
+                _registered_method=True)
+        self.Diagnose = channel.unary_unary(
+                '/parser.ParserWorker/Diagnose',
+                request_serializer=parse__pb2.DiagnoseRequest.SerializeToString,
+                response_deserializer=parse__pb2.DiagnoseResponse.FromString,
+                _registered_method=True)
 
 
 class ParserWorkerServicer(object):
@@ -50,6 +60,18 @@ class ParserWorkerServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def Drain(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def Diagnose(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_ParserWorkerServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -58,6 +80,16 @@ def add_ParserWorkerServicer_to_server(servicer, server):
                     request_deserializer=parse__pb2.ParseRequest.FromString,
                     response_serializer=parse__pb2.ParseResponse.SerializeToString,
             ),
+            'Drain': grpc.unary_unary_rpc_method_handler(
+                    servicer.Drain,
+                    request_deserializer=parse__pb2.DrainRequest.FromString,
+                    response_serializer=parse__pb2.DrainResponse.SerializeToString,
+            ),
+            'Diagnose': grpc.unary_unary_rpc_method_handler(
+                    servicer.Diagnose,
+                    request_deserializer=parse__pb2.DiagnoseRequest.FromString,
+                    response_serializer=parse__pb2.DiagnoseResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'parser.ParserWorker', rpc_method_handlers)
@@ -96,6 +128,60 @@ class ParserWorker(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def Drain(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/parser.ParserWorker/Drain',
+            parse__pb2.DrainRequest.SerializeToString,
+            parse__pb2.DrainResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def Diagnose(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/parser.ParserWorker/Diagnose',
+            parse__pb2.DiagnoseRequest.SerializeToString,
+            parse__pb2.DiagnoseResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
 
 class ParserManagerStub(object):
     """Missing associated documentation comment in .proto file."""
@@ -0,0 +1,136 @@
+import json
+from datetime import datetime, timezone
+
+from playwright.async_api import Error as PlaywrightError
+from playwright.async_api import Page
+
+import app.generated.parse_pb2 as parse_pb2
+
+from app.logger import log
+
+
+def _span(timing: dict, start: str, end: str) -> float:
+    if timing.get(start, -1) < 0 or timing.get(end, -1) < 0:
+        return -1
+    return timing[end] - timing[start]
+
+
+# Collects HAR entries from page events, has to be attached before
+# navigation to see the document request
+class NetworkRecorder:
+    def __init__(self, page: Page) -> None:
+        self.page = page
+        self.entries = []
+        self._responses = {}
+
+    def attach(self) -> None:
+        self.page.on("response", self._on_response)
+        self.page.on("requestfinished", self._on_finished)
+        self.page.on("requestfailed", self._on_finished)
+
+    def _on_response(self, response) -> None:
+        self._responses[response.request] = response
+
+    def _on_finished(self, request) -> None:
+        response = self._responses.pop(request, None)
+        timing = request.timing
+        started = datetime.fromtimestamp(
+            timing["startTime"] / 1000, tz=timezone.utc
+        )
+        timings = {
+            "blocked": -1,
+            "dns": _span(timing, "domainLookupStart", "domainLookupEnd"),
+            "connect": _span(timing, "connectStart", "connectEnd"),
+            "ssl": _span(timing, "secureConnectionStart", "connectEnd"),
+            "send": 0,
+            "wait": _span(timing, "requestStart", "responseStart"),
+            "receive": _span(timing, "responseStart", "responseEnd"),
+        }
+        self.entries.append(
+            {
+                "startedDateTime": started.isoformat(),
+                "time": max(timing.get("responseEnd", -1), 0),
+                "request": {
+                    "method": request.method,
+                    "url": request.url,
+                    "httpVersion": "HTTP/1.1",
+                    "headers": _headers(request.headers),
+                    "queryString": [],
+                    "cookies": [],
+                    "headersSize": -1,
+                    "bodySize": -1,
+                },
+                "response": {
+                    "status": response.status if response else 0,
+                    "statusText": response.status_text if response else "",
+                    "httpVersion": "HTTP/1.1",
+                    "headers": _headers(response.headers) if response else [],
+                    "cookies": [],
+                    "content": {
+                        "size": -1,
+                        "mimeType": (
+                            response.headers.get("content-type", "")
+                            if response
+                            else ""
+                        ),
+                    },
+                    "redirectURL": "",
+                    "headersSize": -1,
+                    "bodySize": -1,
+                    "_failureText": request.failure or "",
+                },
+                "cache": {},
+                "timings": timings,
+                "_resourceType": request.resource_type,
+            }
+        )
+
+    def har(self) -> bytes:
+        return json.dumps(
+            {
+                "log": {
+                    "version": "1.2",
+                    "creator": {"name": "aranea", "version": "0.1.0"},
+                    "pages": [],
+                    "entries": self.entries,
+                }
+            }
+        ).encode()
+
+
+def _headers(headers: dict) -> list[dict]:
+    return [{"name": k, "value": v} for k, v in headers.items()]
+
+
+async def capture_artifacts(
+    page: Page, artifacts: parse_pb2.Artifacts, recorder=None
+) -> tuple[dict, list[str]]:
+    captured = {}
+    errors = []
+
+    if artifacts.screenshot:
+        try:
+            if artifacts.selector:
+                captured["screenshot"] = await page.locator(
+                    artifacts.selector
+                ).first.screenshot(type="png")
+            else:
+                captured["screenshot"] = await page.screenshot(
+                    type="png", full_page=artifacts.full_page
+                )
+        except PlaywrightError as e:
+            errors.append(f"screenshot: {e.message}")
+
+    if artifacts.pdf:
+        try:
+            captured["pdf"] = await page.pdf()
+        except PlaywrightError as e:
+            # Only Chromium can print to PDF
+            errors.append(f"pdf: {e.message}")
+
+    if recorder:
+        captured["har"] = recorder.har()
+
+    for error in errors:
+        log.warning(f"Failed to capture artifact {error}")
+    return captured, errors
@@ -0,0 +1,228 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Optional
+
+from playwright.async_api import Route
+
+from app.config import settings
+from app.logger import log
+
+# Playwright hands out decoded bodies, so transport headers must not be
+# replayed from the cache
+DROP_HEADERS = ("content-encoding", "content-length", "transfer-encoding")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    url TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_digest ON entries (digest);
+CREATE INDEX IF NOT EXISTS objects_last_access ON objects (last_access);
+"""
+
+
+# Seconds a shared cache may serve the response for, None if not cacheable
+def freshness(headers: dict[str, str]) -> Optional[float]:
+    directives = {}
+    for part in headers.get("cache-control", "").split(","):
+        name, _, value = part.strip().lower().partition("=")
+        if name:
+            directives[name] = value.strip('"')
+
+    if {"no-store", "no-cache", "private"} & directives.keys():
+        return None
+    if headers.get("vary", "").strip().lower() not in ("", "accept-encoding"):
+        return None
+
+    for name in ("s-maxage", "max-age"):
+        if name in directives:
+            try:
+                ttl = float(directives[name])
+            except ValueError:
+                return None
+            return ttl if ttl > 0 else None
+
+    if "expires" in headers:
+        try:
+            expires = parsedate_to_datetime(headers["expires"]).timestamp()
+        except (TypeError, ValueError):
+            return None
+        ttl = expires - time.time()
+        return ttl if ttl > 0 else None
+    return None
+
+
+# Writes content-addressed data: concurrent writers of the same digest
+# each get their own temp file and the target is written only once
+def atomic_write(path: Path, data: bytes) -> None:
+    if path.exists():
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        dir=path.parent, suffix=".tmp", delete=False
+    ) as tmp:
+        tmp.write(data)
+    try:
+        os.replace(tmp.name, path)
+    except OSError:
+        Path(tmp.name).unlink(missing_ok=True)
+        if not path.exists():
+            raise
+
+
+class ResourceCache:
+    def __init__(self, path: str = settings.cache.dir) -> None:
+        self.path = Path(path)
+        self.objects_path = self.path / "objects"
+        self.objects_path.mkdir(parents=True, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+
+        # The index lives next to the objects so every worker on the host
+        # shares the same cache
+        self._db = sqlite3.connect(
+            self.path / "index.db", timeout=30, check_same_thread=False
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self._db_lock = threading.Lock()
+
+    def accepts(self, request) -> bool:
+        return (
+            request.method == "GET"
+            and request.resource_type in settings.cache.resource_types
+        )
+
+    def _object_path(self, digest: str) -> Path:
+        return self.objects_path / digest[:2] / digest
+
+    def _lookup(self, url: str) -> Optional[tuple[int, dict, bytes]]:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT digest, status, headers FROM entries "
+                "WHERE url = ? AND expires > ?",
+                (url, time.time()),
+            ).fetchone()
+            if not row:
+                return None
+            digest, status, headers = row
+            self._db.execute(
+                "UPDATE objects SET last_access = ? WHERE digest = ?",
+                (time.time(), digest),
+            )
+            self._db.commit()
+
+        try:
+            body = self._object_path(digest).read_bytes()
+        except FileNotFoundError:
+            return None
+        return status, json.loads(headers), body
+
+    def _store(
+        self, url: str, status: int, headers: dict, body: bytes, ttl: float
+    ) -> None:
+        digest = hashlib.sha256(body).hexdigest()
+        atomic_write(self._object_path(digest), body)
+
+        headers = {
+            k: v for k, v in headers.items() if k.lower() not in DROP_HEADERS
+        }
+        now = time.time()
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO objects VALUES (?, ?, ?)",
+                (digest, len(body), now),
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (url, digest, status, json.dumps(headers), now + ttl),
+            )
+            self._db.commit()
+            self._evict()
+
+    def _evict(self) -> None:
+        (total,) = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM objects"
+        ).fetchone()
+        if total <= settings.cache.max_size:
+            return
+
+        # Drop least recently used objects down to 90% of the limit so we
+        # don't evict on every store
+        target = settings.cache.max_size * 0.9
+        rows = self._db.execute(
+            "SELECT digest, size FROM objects ORDER BY last_access"
+        ).fetchall()
+        evicted = []
+        for digest, size in rows:
+            if total <= target:
+                break
+            evicted.append(digest)
+            total -= size
+
+        for digest in evicted:
+            self._db.execute("DELETE FROM entries WHERE digest = ?", (digest,))
+            self._db.execute("DELETE FROM objects WHERE digest = ?", (digest,))
+            self._object_path(digest).unlink(missing_ok=True)
+        self._db.commit()
+        log.info(f"Evicted {len(evicted)} objects from resource cache")
+
+    async def handle(self, route: Route) -> None:
+        url = route.request.url
+        cached = await asyncio.to_thread(self._lookup, url)
+        if cached:
+            self.hits += 1
+            status, headers, body = cached
+            await route.fulfill(status=status, headers=headers, body=body)
+            return
+
+        self.misses += 1
+        try:
+            response = await route.fetch()
+            body = await response.body()
+        except Exception as e:
+            log.debug(f"Resource fetch failed for {url}: {e}")
+            await route.abort("failed")
+            return
+
+        ttl = (
+            freshness(response.headers)
+            if response.status == 200
+            and len(body) <= settings.cache.max_object_size
+            else None
+        )
+        if ttl:
+            try:
+                await asyncio.to_thread(
+                    self._store,
+                    url,
+                    response.status,
+                    response.headers,
+                    body,
+                    ttl,
+                )
+            except Exception as e:
+                # The page still gets the resource, it just isn't cached
+                log.warning(f"Failed to cache {url}: {e}")
+        await route.fulfill(response=response, body=body)
+
+    def close(self) -> None:
+        with self._db_lock:
+            self._db.close()
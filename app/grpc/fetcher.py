@@ -0,0 +1,150 @@
+import re
+from typing import Optional
+
+import aiohttp
+
+import app.generated.parse_pb2 as parse_pb2
+
+from app.config import settings
+from app.grpc.proxy import ProxyError, ProxyGatewayError
+
+BLOCKED_STATUSES = (403, 429, 503)
+
+# Anti-bot interstitials that only a real browser gets through
+CHALLENGE_MARKERS = (
+    "challenge-platform",
+    "cf-browser-verification",
+    "_Incapsula_Resource",
+    "Just a moment...",
+    "captcha",
+    "Enable JavaScript and cookies to continue",
+)
+
+# Empty mount points of client-side rendered apps
+EMPTY_ROOT_RE = re.compile(
+    r"<div[^>]+id=[\"'](root|app|__next|__nuxt)[\"'][^>]*>\s*</div>", re.I
+)
+NOSCRIPT_RE = re.compile(
+    r"<noscript[^>]*>.*?javascript.*?</noscript>", re.I | re.S
+)
+SCRIPT_RE = re.compile(r"<(script|style)[^>]*>.*?</\1>", re.I | re.S)
+TAG_RE = re.compile(r"<[^>]+>")
+
+
+def visible_text_length(content: str) -> int:
+    text = TAG_RE.sub(" ", SCRIPT_RE.sub(" ", content))
+    return len("".join(text.split()))
+
+
+# Returns the reason the page needs a browser, or None if the HTTP result
+# is good enough
+def needs_browser(response: parse_pb2.ParseResponse) -> Optional[str]:
+    if response.status in BLOCKED_STATUSES:
+        return f"status {response.status}"
+
+    content_type = response.headers.get("content-type", "")
+    if "html" not in content_type:
+        return None
+
+    content = response.content
+    if any(marker in content for marker in CHALLENGE_MARKERS):
+        return "challenge page"
+    if EMPTY_ROOT_RE.search(content):
+        return "empty app root"
+    if (
+        visible_text_length(content) < settings.http.min_text_length
+        and ("<script" in content or NOSCRIPT_RE.search(content))
+    ):
+        return "no visible text"
+    return None
+
+
+class HttpFetcher:
+    def __init__(self) -> None:
+        self._connector: Optional[aiohttp.TCPConnector] = None
+
+    def _get_connector(self) -> aiohttp.TCPConnector:
+        if self._connector is None or self._connector.closed:
+            self._connector = aiohttp.TCPConnector(
+                limit=settings.http.pool_size,
+                limit_per_host=settings.http.pool_size_per_host,
+                ttl_dns_cache=settings.http.dns_cache_ttl,
+            )
+        return self._connector
+
+    async def fetch(
+        self, request, proxy: Optional[dict]
+    ) -> parse_pb2.ParseResponse:
+        proxy_url = proxy_auth = None
+        if proxy:
+            if not proxy["server"].startswith(("http://", "https://")):
+                raise ValueError(
+                    f"Proxy {proxy['server']} is not supported in http mode"
+                )
+            proxy_url = proxy["server"]
+            if "username" in proxy:
+                proxy_auth = aiohttp.BasicAuth(
+                    proxy["username"], proxy["password"]
+                )
+
+        timeout = (request.timeout or settings.browser.timeout) / 1000
+
+        # A fresh cookie jar per request keeps cookie isolation the same as
+        # a new browser page, while connections are shared through the pool
+        async with aiohttp.ClientSession(
+            connector=self._get_connector(),
+            connector_owner=False,
+            cookie_jar=aiohttp.CookieJar(),
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        ) as session:
+            try:
+                async with session.get(
+                    request.url,
+                    headers=dict(request.headers),
+                    proxy=proxy_url,
+                    proxy_auth=proxy_auth,
+                    max_redirects=settings.http.max_redirects,
+                ) as response:
+                    content = await response.text(errors="replace")
+            except aiohttp.ClientProxyConnectionError as e:
+                raise ProxyError(str(e)) from e
+            except aiohttp.ClientHttpProxyError as e:
+                # Any other CONNECT reply is the proxy reporting on the
+                # target
+                if e.status == 407:
+                    raise ProxyError(str(e)) from e
+                raise ProxyGatewayError(str(e)) from e
+
+            headers = {}
+            for key, value in response.headers.items():
+                key = key.lower()
+                headers[key] = (
+                    f"{headers[key]}\n{value}" if key in headers else value
+                )
+
+            cookies = [
+                parse_pb2.Cookie(
+                    name=morsel.key,
+                    value=morsel.value,
+                    domain=morsel["domain"],
+                    path=morsel["path"],
+                    expires=-1,
+                    http_only=bool(morsel["httponly"]),
+                    secure=bool(morsel["secure"]),
+                    same_site=morsel["samesite"] or "None",
+                )
+                for morsel in session.cookie_jar
+            ]
+
+        return parse_pb2.ParseResponse(
+            status=response.status,
+            content=content,
+            error="",
+            headers=headers,
+            cookies=cookies,
+            url=str(response.url),
+        )
+
+    async def close(self) -> None:
+        if self._connector and not self._connector.closed:
+            await self._connector.close()
@@ -0,0 +1,214 @@
+import hashlib
+import re
+from functools import lru_cache
+from html.parser import HTMLParser
+
+import app.generated.parse_pb2 as parse_pb2
+
+from app.config import settings
+
+VOID_ELEMENTS = {
+    "area",
+    "base",
+    "br",
+    "col",
+    "embed",
+    "hr",
+    "img",
+    "input",
+    "link",
+    "meta",
+    "source",
+    "track",
+    "wbr",
+}
+
+# Start tags that close an open element of the listed kinds, as in
+# `<li>one<li>two`
+IMPLIED_END = {
+    "li": {"li"},
+    "option": {"option"},
+    "optgroup": {"option", "optgroup"},
+    "dt": {"dt", "dd"},
+    "dd": {"dt", "dd"},
+    "tr": {"tr", "td", "th"},
+    "td": {"td", "th"},
+    "th": {"td", "th"},
+}
+# Block start tags that close an open paragraph
+CLOSES_P = {
+    "address",
+    "article",
+    "aside",
+    "blockquote",
+    "dd",
+    "div",
+    "dl",
+    "dt",
+    "fieldset",
+    "footer",
+    "form",
+    "h1",
+    "h2",
+    "h3",
+    "h4",
+    "h5",
+    "h6",
+    "header",
+    "hr",
+    "li",
+    "main",
+    "nav",
+    "ol",
+    "p",
+    "pre",
+    "section",
+    "table",
+    "ul",
+}
+
+# Compound selectors only: tag, #id, .class and [attr] / [attr=value]
+SELECTOR_RE = re.compile(
+    r"^(?P<tag>[a-zA-Z][\w-]*|\*)?(?P<simple>(?:[#.][\w-]+)*)"
+    r"(?P<attrs>(?:\[[^\]]+\])*)$"
+)
+SIMPLE_RE = re.compile(r"([#.])([\w-]+)")
+ATTR_RE = re.compile(r"\[\s*([\w-]+)\s*(?:=\s*[\"']?([^\"'\]]*)[\"']?)?\s*\]")
+WORD_RE = re.compile(r"\w+")
+
+
+class Selector:
+    def __init__(self, source: str) -> None:
+        match = SELECTOR_RE.match(source.strip())
+        if not match or not source.strip():
+            raise ValueError(f"Unsupported ignore selector: {source}")
+
+        self.tag = (match["tag"] or "*").lower()
+        self.id = None
+        self.classes = set()
+        for kind, name in SIMPLE_RE.findall(match["simple"]):
+            if kind == "#":
+                self.id = name
+            else:
+                self.classes.add(name)
+        self.attrs = [
+            (name.lower(), value if value else None)
+            for name, value in ATTR_RE.findall(match["attrs"])
+        ]
+
+    def matches(self, tag: str, attrs: dict) -> bool:
+        if self.tag != "*" and self.tag != tag:
+            return False
+        if self.id and attrs.get("id") != self.id:
+            return False
+        if self.classes - set((attrs.get("class") or "").split()):
+            return False
+        return all(
+            name in attrs and (value is None or attrs[name] == value)
+            for name, value in self.attrs
+        )
+
+
+@lru_cache(maxsize=64)
+def _selectors(ignore: tuple[str, ...]) -> list[Selector]:
+    return [Selector(source) for source in ignore]
+
+
+# Collects the visible text, skipping everything under ignored elements.
+# Open elements are kept on a stack so that elements closed implicitly,
+# by a sibling or by their parent's end tag, end the skip too
+class TextExtractor(HTMLParser):
+    def __init__(self, selectors: list[Selector]) -> None:
+        super().__init__(convert_charrefs=True)
+        self.selectors = selectors
+        self.parts = []
+        self._stack = []
+        # Stack depth of the ignored element being skipped, 0 when none
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs) -> None:
+        closes = IMPLIED_END.get(tag, set())
+        if tag in CLOSES_P:
+            closes = closes | {"p"}
+        while self._stack and self._stack[-1] in closes:
+            self._pop()
+
+        if tag in VOID_ELEMENTS:
+            return
+        self._stack.append(tag)
+        if self._skip_depth:
+            return
+        attrs = {name: value or "" for name, value in attrs}
+        if any(selector.matches(tag, attrs) for selector in self.selectors):
+            self._skip_depth = len(self._stack)
+
+    def handle_endtag(self, tag) -> None:
+        # Stray end tags are ignored, like browsers do
+        if tag not in self._stack:
+            return
+        while self._stack[-1] != tag:
+            self._pop()
+        self._pop()
+
+    def _pop(self) -> None:
+        self._stack.pop()
+        if len(self._stack) < self._skip_depth:
+            self._skip_depth = 0
+
+    def handle_data(self, data) -> None:
+        if not self._skip_depth:
+            self.parts.append(data)
+
+
+def normalize(content: str, ignore: tuple[str, ...] = ()) -> str:
+    extractor = TextExtractor(
+        _selectors(tuple(settings.fingerprint.ignore_selectors) + ignore)
+    )
+    extractor.feed(content)
+    extractor.close()
+    return " ".join(" ".join(extractor.parts).split())
+
+
+def simhash(
+    text: str, shingle: int = settings.fingerprint.shingle_size
+) -> int:
+    words = WORD_RE.findall(text.lower())
+    shingles = [
+        " ".join(words[i : i + shingle])
+        for i in range(max(len(words) - shingle + 1, 1))
+    ]
+    weights = [0] * 64
+    for value in shingles:
+        digest = int.from_bytes(
+            hashlib.blake2b(value.encode(), digest_size=8).digest(), "big"
+        )
+        for bit in range(64):
+            weights[bit] += 1 if digest >> bit & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+def distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def fingerprint(
+    content: str, ignore: tuple[str, ...] = (), with_simhash: bool = False
+) -> parse_pb2.Fingerprint:
+    text = normalize(content, ignore)
+    return parse_pb2.Fingerprint(
+        hash=hashlib.sha256(text.encode()).hexdigest(),
+        simhash=simhash(text) if with_simhash else 0,
+    )
+
+
+def unchanged(
+    current: parse_pb2.Fingerprint, previous: parse_pb2.Fingerprint
+) -> bool:
+    if previous.hash and previous.hash == current.hash:
+        return True
+    return bool(
+        previous.simhash
+        and current.simhash
+        and distance(previous.simhash, current.simhash)
+        <= settings.fingerprint.max_distance
+    )
@@ -0,0 +1,110 @@
+import statistics
+import time
+from collections import deque
+from typing import Optional
+
+import psutil
+
+from app.config import settings
+from app.logger import log
+
+
+class LimitExceeded(RuntimeError):
+    pass
+
+
+# AIMD limit on in-flight pages: grows by one page per limit's worth of
+# successful renders while the limit is in use, and is cut by `backoff`
+# on timeouts, renders much slower than the recent baseline or a loaded
+# host. Unless `initial_limit` is set it starts at `browser.max_pages`,
+# the static limit when adaptation is off, and can grow to `max_limit`
+# on hosts with room to spare
+class AdaptiveLimiter:
+    def __init__(
+        self,
+        initial: int = settings.limiter.initial_limit,
+        min_limit: int = settings.limiter.min_limit,
+        max_limit: int = settings.limiter.max_limit,
+    ) -> None:
+        static = settings.browser.max_pages
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, static)
+        self.limit = float(
+            min(initial or static, self.max_limit)
+            if settings.limiter.adaptive
+            else static
+        )
+        self.in_flight = 0
+
+        self._latencies = deque(maxlen=settings.limiter.window)
+        self._last_decrease = 0.0
+        self._last_load_check = 0.0
+        self._overloaded = False
+
+    @property
+    def current(self) -> int:
+        return max(int(self.limit), self.min_limit)
+
+    def acquire(self) -> None:
+        if self.in_flight >= self.current:
+            raise LimitExceeded(f"Page limit of {self.current} reached")
+        self.in_flight += 1
+
+    # `latency` is given for successful renders only; a timeout passes
+    # `congested` and other failures pass neither
+    def release(
+        self, latency: Optional[float] = None, congested: bool = False
+    ) -> None:
+        self.in_flight -= 1
+        if not settings.limiter.adaptive:
+            return
+
+        now = time.monotonic()
+        self._check_load(now)
+        baseline = self._baseline()
+        if latency is not None:
+            self._latencies.append(latency)
+
+        if (
+            congested
+            or self._overloaded
+            or (
+                latency is not None
+                and baseline
+                and latency > baseline * settings.limiter.latency_tolerance
+            )
+        ):
+            self._decrease(now, latency or 0.0)
+        elif latency is not None and self.in_flight + 1 >= self.current:
+            # Only grow when the limit is what's holding us back
+            self.limit = min(self.limit + 1 / self.limit, self.max_limit)
+
+    # Median of recent renders. A low percentile would be set by the
+    # fastest pages, and ordinary ones would look congested against it
+    def _baseline(self) -> Optional[float]:
+        if len(self._latencies) < self._latencies.maxlen // 2:
+            return None
+        return statistics.median(self._latencies)
+
+    def _check_load(self, now: float) -> None:
+        if now - self._last_load_check < 1:
+            return
+        self._last_load_check = now
+        self._overloaded = (
+            psutil.cpu_percent() > settings.limiter.cpu_threshold
+            or psutil.virtual_memory().percent
+            > settings.limiter.memory_threshold
+        )
+
+    def _decrease(self, now: float, latency: float) -> None:
+        # Pages that were in flight together see the same congestion, cut
+        # once for them rather than once per page
+        if now - self._last_decrease < max(latency, 1):
+            return
+        self._last_decrease = now
+        previous = self.current
+        self.limit = max(
+            self.limit * settings.limiter.backoff, float(self.min_limit)
+        )
+        if self.current != previous:
+            log.info(f"Page limit {previous} -> {self.current}")
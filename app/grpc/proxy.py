@@ -0,0 +1,203 @@
+import asyncio
+import time
+from collections import deque
+from typing import Optional
+
+from app.config import settings
+from app.logger import log
+
+# Firefox network errors that mean the proxy can't be reached or won't
+# let us in. Resets, timeouts and refusals without PROXY in the name are
+# about the target
+PROXY_ERRORS = (
+    "NS_ERROR_UNKNOWN_PROXY_HOST",
+    "NS_ERROR_PROXY_CONNECTION_REFUSED",
+    "NS_ERROR_PROXY_AUTHENTICATION_FAILED",
+)
+
+# Errors a working proxy returns when it can't reach the target
+GATEWAY_ERRORS = (
+    "NS_ERROR_PROXY_BAD_GATEWAY",
+    "NS_ERROR_PROXY_GATEWAY_TIMEOUT",
+)
+
+
+class ProxyError(RuntimeError):
+    pass
+
+
+class ProxyGatewayError(RuntimeError):
+    pass
+
+
+# Accepts `[scheme://][user:pass@]host:port`
+def parse_proxy(value: str) -> dict:
+    creds, _, server = value.rpartition("@")
+    scheme = "http"
+    if "://" in creds:
+        scheme, creds = creds.split("://", 1)
+    if "://" in server:
+        scheme, server = server.split("://", 1)
+
+    host, _, port = server.rstrip("/").rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError("Invalid proxy format")
+
+    proxy = {"server": f"{scheme}://{host}:{port}"}
+    if creds:
+        username, sep, password = creds.partition(":")
+        if not sep:
+            raise ValueError("Invalid proxy format")
+        proxy["username"] = username
+        proxy["password"] = password
+    return proxy
+
+
+def is_proxy_error(error: Exception) -> bool:
+    if isinstance(error, ProxyError):
+        return True
+    message = str(error)
+    return any(marker in message for marker in PROXY_ERRORS)
+
+
+def is_gateway_error(error: Exception) -> bool:
+    if isinstance(error, ProxyGatewayError):
+        return True
+    message = str(error)
+    return any(marker in message for marker in GATEWAY_ERRORS)
+
+
+class Proxy:
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.settings = parse_proxy(url)
+        host_port = self.settings["server"].split("://", 1)[1]
+        self.host, _, port = host_port.rpartition(":")
+        self.port = int(port)
+
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.latencies = deque(maxlen=settings.proxy.latency_window)
+        self.last_used = 0.0
+        self.last_checked = 0.0
+        self.quarantined_until = 0.0
+
+    @property
+    def success_rate(self) -> float:
+        total = self.successes + self.failures
+        return self.successes / total if total else 1.0
+
+    @property
+    def latency(self) -> float:
+        if not self.latencies:
+            return 0.0
+        return sum(self.latencies) / len(self.latencies)
+
+    @property
+    def score(self) -> float:
+        return self.success_rate / (1.0 + self.latency)
+
+    def is_available(self, now: float) -> bool:
+        return self.quarantined_until <= now
+
+    def __repr__(self) -> str:
+        return f"Proxy({self.settings['server']})"
+
+
+class ProxyPool:
+    def __init__(
+        self, urls: list[str], strategy: str = settings.proxy.strategy
+    ) -> None:
+        if strategy not in ("round_robin", "least_recently_used", "sticky"):
+            raise ValueError(f"Unknown proxy strategy: {strategy}")
+
+        self.strategy = strategy
+        self.proxies = [Proxy(url) for url in urls]
+        self._next = 0
+        self._sticky: dict[str, Proxy] = {}
+
+    def __len__(self) -> int:
+        return len(self.proxies)
+
+    def _order(self, candidates: list[Proxy], key: Optional[str]):
+        if self.strategy == "round_robin":
+            start = self._next % max(len(self.proxies), 1)
+            self._next += 1
+            rotated = self.proxies[start:] + self.proxies[:start]
+            return [p for p in rotated if p in candidates]
+
+        if self.strategy == "least_recently_used":
+            return sorted(candidates, key=lambda p: p.last_used)
+
+        ordered = sorted(candidates, key=lambda p: p.score, reverse=True)
+        sticky = self._sticky.get(key) if key else None
+        if sticky in candidates:
+            ordered.remove(sticky)
+            ordered.insert(0, sticky)
+        return ordered
+
+    async def acquire(
+        self, key: Optional[str] = None, exclude: tuple = ()
+    ) -> Proxy:
+        now = time.monotonic()
+        candidates = [
+            p
+            for p in self.proxies
+            if p.is_available(now) and p not in exclude
+        ]
+
+        for proxy in self._order(candidates, key):
+            if not await self.check(proxy):
+                continue
+            proxy.last_used = time.monotonic()
+            if self.strategy == "sticky" and key:
+                self._sticky[key] = proxy
+            return proxy
+
+        raise ProxyError("No healthy proxies available")
+
+    async def check(self, proxy: Proxy) -> bool:
+        # Cheap TCP probe so a dead proxy fails in milliseconds instead of
+        # burning a whole page timeout
+        now = time.monotonic()
+        if now - proxy.last_checked < settings.proxy.check_interval / 1000:
+            return True
+
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(proxy.host, proxy.port),
+                timeout=settings.proxy.connect_timeout / 1000,
+            )
+            writer.close()
+            proxy.last_checked = now
+            return True
+        except (OSError, asyncio.TimeoutError) as e:
+            log.warning(f"Proxy {proxy} health check failed: {e}")
+            self.report_failure(proxy, fatal=True)
+            return False
+
+    def report_success(self, proxy: Proxy, latency: float) -> None:
+        proxy.successes += 1
+        proxy.consecutive_failures = 0
+        proxy.latencies.append(latency)
+        proxy.last_checked = time.monotonic()
+
+    def report_failure(self, proxy: Proxy, fatal: bool = False) -> None:
+        proxy.failures += 1
+        proxy.consecutive_failures += 1
+        if fatal or (
+            proxy.consecutive_failures >= settings.proxy.failure_threshold
+        ):
+            self.quarantine(proxy)
+
+    def quarantine(self, proxy: Proxy) -> None:
+        log.warning(f"Quarantining proxy {proxy}")
+        proxy.quarantined_until = (
+            time.monotonic() + settings.proxy.quarantine_time / 1000
+        )
+        # Force a fresh probe once the quarantine is over
+        proxy.last_checked = 0.0
+        proxy.consecutive_failures = 0
+        for key in [k for k, p in self._sticky.items() if p is proxy]:
+            del self._sticky[key]
@@ -0,0 +1,123 @@
+import asyncio
+from urllib.parse import urlsplit
+
+from playwright.async_api import Page
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+import app.generated.parse_pb2 as parse_pb2
+
+from app.config import settings
+from app.logger import log
+
+STRATEGIES = ("dom_quiet", "network_quiet", "selector", "text")
+
+# The strategy a request waits with, checked before a page is opened
+def readiness_strategy(ready: parse_pb2.Readiness) -> str:
+    strategy = ready.strategy or settings.browser.ready_strategy or "dom_quiet"
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown readiness strategy: {strategy}")
+    if strategy in ("selector", "text") and not getattr(ready, strategy):
+        raise ValueError(f"Readiness {strategy} is required")
+    return strategy
+
+
+# Resolves once the DOM has not changed for `quiet` ms
+DOM_QUIET_JS = """
+(quiet) => new Promise((resolve) => {
+  let timer;
+  const observer = new MutationObserver(() => {
+    clearTimeout(timer);
+    timer = setTimeout(done, quiet);
+  });
+  function done() {
+    observer.disconnect();
+    resolve(true);
+  }
+  observer.observe(document, {
+    subtree: true, childList: true, attributes: true, characterData: true,
+  });
+  timer = setTimeout(done, quiet);
+})
+"""
+
+
+class ReadinessWaiter:
+    def __init__(self, page: Page, ready: parse_pb2.Readiness) -> None:
+        self.page = page
+        self.strategy = readiness_strategy(ready)
+        self.selector = ready.selector
+        self.text = ready.text
+        self.ignore_hosts = tuple(ready.ignore_hosts)
+        self.quiet = (ready.quiet or settings.browser.ready_quiet) / 1000
+        self.cap = (ready.cap or settings.browser.ready_cap) / 1000
+
+        self._inflight = set()
+        self._last_activity = 0.0
+
+    # Network tracking has to start before navigation
+    def attach(self) -> None:
+        if self.strategy != "network_quiet":
+            return
+        self._last_activity = asyncio.get_running_loop().time()
+        self.page.on("request", self._on_request)
+        self.page.on("requestfinished", self._on_done)
+        self.page.on("requestfailed", self._on_done)
+
+    def _ignored(self, url: str) -> bool:
+        host = urlsplit(url).hostname or ""
+        return any(
+            host == h or host.endswith(f".{h}") for h in self.ignore_hosts
+        )
+
+    def _on_request(self, request) -> None:
+        if not self._ignored(request.url):
+            self._inflight.add(request)
+            self._last_activity = asyncio.get_running_loop().time()
+
+    def _on_done(self, request) -> None:
+        if request in self._inflight:
+            self._inflight.discard(request)
+            self._last_activity = asyncio.get_running_loop().time()
+
+    async def _network_quiet(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            idle = loop.time() - self._last_activity
+            if not self._inflight and idle >= self.quiet:
+                return
+            await asyncio.sleep(max(self.quiet - idle, 0.05))
+
+    # Returns False if the cap was reached before the page settled
+    async def wait(self) -> bool:
+        try:
+            if self.strategy == "dom_quiet":
+                await asyncio.wait_for(
+                    self.page.evaluate(DOM_QUIET_JS, self.quiet * 1000),
+                    timeout=self.cap,
+                )
+            elif self.strategy == "network_quiet":
+                await asyncio.wait_for(self._network_quiet(), timeout=self.cap)
+            elif self.strategy == "selector":
+                await self.page.wait_for_selector(
+                    self.selector, timeout=self.cap * 1000
+                )
+            else:
+                await self.page.get_by_text(self.text).first.wait_for(
+                    timeout=self.cap * 1000
+                )
+            return True
+        except (asyncio.TimeoutError, PlaywrightTimeoutError):
+            log.warning(
+                f"Page {self.page.url} not ready ({self.strategy}) after "
+                f"{self.cap}s, returning current content"
+            )
+            return False
+        finally:
+            self.detach()
+
+    def detach(self) -> None:
+        if self.strategy != "network_quiet":
+            return
+        self.page.remove_listener("request", self._on_request)
+        self.page.remove_listener("requestfinished", self._on_done)
+        self.page.remove_listener("requestfailed", self._on_done)
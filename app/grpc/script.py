@@ -0,0 +1,179 @@
+import json
+from functools import lru_cache
+
+from app.config import settings
+
+MAX_TIMINGS = 1000
+# Where the running script keeps its timings, so the steps that finished
+# can still be read after the script times out
+TIMINGS_GLOBAL = "__araneaTimings"
+
+# The whole script runs inside one `page.evaluate` call, so a multi-step
+# interaction costs a single protocol round trip
+RUNTIME_JS = """
+async () => {
+  const timings = (window.%(timings_global)s = []);
+  const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+  const $ = (selector) => document.querySelector(selector);
+  const count = (selector) => document.querySelectorAll(selector).length;
+  const message = (e) => String((e && e.message) || e);
+  const waitFor = async (selector, timeout) => {
+    const end = Date.now() + timeout;
+    while (!$(selector)) {
+      if (Date.now() > end) {
+        throw new Error(`Timeout ${timeout}ms waiting for ${selector}`);
+      }
+      await sleep(50);
+    }
+    return $(selector);
+  };
+  const step = async (path, op, fn) => {
+    const start = performance.now();
+    let error = "";
+    try {
+      return await fn();
+    } catch (e) {
+      error = message(e);
+      throw e;
+    } finally {
+      if (timings.length < %(max_timings)d) {
+        timings.push({ path, op, duration: performance.now() - start, error });
+      }
+    }
+  };
+  let result = null;
+  try {
+%(body)s
+  } catch (e) {
+    return { timings, result, error: message(e) };
+  }
+  return { timings, result, error: "" };
+}
+"""
+
+OPS = (
+    "click",
+    "fill",
+    "wait",
+    "wait_for",
+    "scroll",
+    "scroll_until",
+    "if",
+    "repeat",
+    "evaluate",
+)
+
+
+def _op(step: dict) -> str:
+    if not isinstance(step, dict):
+        raise ValueError(f"Script step must be an object, got {step!r}")
+    ops = [op for op in OPS if op in step]
+    if len(ops) != 1:
+        raise ValueError(f"Script step must have exactly one of {OPS}")
+    return ops[0]
+
+
+def _compile_steps(steps: list, path: str, indent: str) -> list[str]:
+    if not isinstance(steps, list):
+        raise ValueError(f"Script steps at {path or 'root'} must be a list")
+
+    lines = []
+    for index, step in enumerate(steps):
+        step_path = f"{path}.{index}" if path else str(index)
+        lines.extend(_compile_step(step, step_path, indent))
+    return lines
+
+
+def _compile_step(step: dict, path: str, indent: str) -> list[str]:
+    op = _op(step)
+    arg = step[op]
+    timeout = int(step.get("timeout", settings.browser.script_step_timeout))
+    p, o, a = json.dumps(path), json.dumps(op), json.dumps(arg)
+
+    if op == "click":
+        return [
+            f"{indent}await step({p}, {o}, async () => "
+            f"(await waitFor({a}, {timeout})).click());"
+        ]
+    if op == "fill":
+        value = json.dumps(str(step.get("value", "")))
+        return [
+            f"{indent}await step({p}, {o}, async () => {{",
+            f"{indent}  const el = await waitFor({a}, {timeout});",
+            f"{indent}  el.focus();",
+            f"{indent}  el.value = {value};",
+            f"{indent}  for (const type of ['input', 'change']) {{",
+            f"{indent}    el.dispatchEvent("
+            f"new Event(type, {{ bubbles: true }}));",
+            f"{indent}  }}",
+            f"{indent}}});",
+        ]
+    if op == "wait":
+        return [f"{indent}await step({p}, {o}, () => sleep({int(arg)}));"]
+    if op == "wait_for":
+        return [
+            f"{indent}await step({p}, {o}, () => waitFor({a}, {timeout}));"
+        ]
+    if op == "scroll":
+        target = (
+            "window.scrollTo(0, document.body.scrollHeight)"
+            if arg == "bottom"
+            else f"window.scrollBy(0, {int(arg)})"
+        )
+        return [f"{indent}await step({p}, {o}, async () => {target});"]
+    if op == "scroll_until":
+        # Scroll until the number of matching items stops growing
+        limit = int(step.get("max", 50))
+        delay = int(step.get("delay", 500))
+        return [
+            f"{indent}result = await step({p}, {o}, async () => {{",
+            f"{indent}  let seen = count({a});",
+            f"{indent}  for (let i = 0; i < {limit}; i++) {{",
+            f"{indent}    window.scrollTo(0, document.body.scrollHeight);",
+            f"{indent}    await sleep({delay});",
+            f"{indent}    const now = count({a});",
+            f"{indent}    if (now <= seen) break;",
+            f"{indent}    seen = now;",
+            f"{indent}  }}",
+            f"{indent}  return seen;",
+            f"{indent}}});",
+        ]
+    if op == "if":
+        nested = indent + "  "
+        lines = [f"{indent}if (await step({p}, {o}, async () => !!$({a}))) {{"]
+        lines += _compile_steps(step.get("then", []), f"{path}.then", nested)
+        lines.append(f"{indent}}} else {{")
+        lines += _compile_steps(step.get("else", []), f"{path}.else", nested)
+        lines.append(f"{indent}}}")
+        return lines
+    if op == "repeat":
+        condition = step.get("while")
+        lines = [f"{indent}for (let i = 0; i < {int(arg)}; i++) {{"]
+        if condition:
+            lines.append(f"{indent}  if (!$({json.dumps(condition)})) break;")
+        lines += _compile_steps(step.get("steps", []), path, indent + "  ")
+        lines.append(f"{indent}}}")
+        return lines
+
+    # evaluate: the argument is a function body, its return value becomes
+    # the script result
+    return [
+        f"{indent}result = await step({p}, {o}, async () => {{",
+        f"{indent}  {arg}",
+        f"{indent}}});",
+    ]
+
+
+@lru_cache(maxsize=256)
+def compile_script(source: str) -> str:
+    try:
+        steps = json.loads(source)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid script: {e}") from e
+
+    body = "\n".join(_compile_steps(steps, "", "    "))
+    return RUNTIME_JS % {
+        "body": body,
+        "max_timings": MAX_TIMINGS,
+        "timings_global": TIMINGS_GLOBAL,
+    }
@@ -0,0 +1,425 @@
+import asyncio
+import base64
+import gzip
+import hashlib
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+from google.protobuf.json_format import MessageToDict
+
+import app.generated.parse_pb2 as parse_pb2
+
+from app.config import settings
+from app.grpc.cache import DROP_HEADERS, atomic_write
+from app.logger import log
+
+SINKS = ("jsonl", "warc", "blob")
+ARTIFACTS = ("screenshot", "pdf", "har")
+REVISIT_PROFILE = (
+    "http://netpreserve.org/warc/1.1/revisit/identical-payload-digest"
+)
+
+
+def _record(
+    response: parse_pb2.ParseResponse, artifacts: bool = True
+) -> dict:
+    record = {
+        "url": response.url,
+        "status": response.status,
+        "error": response.error,
+        "partial": response.partial,
+        "headers": dict(response.headers),
+        "cookies": [
+            MessageToDict(cookie, preserving_proto_field_name=True)
+            for cookie in response.cookies
+        ],
+        "content": response.content,
+        "timings": [
+            MessageToDict(timing, preserving_proto_field_name=True)
+            for timing in response.timings
+        ],
+        "script_result": (
+            json.loads(response.script_result)
+            if response.script_result
+            else None
+        ),
+    }
+    if artifacts:
+        for name in ARTIFACTS:
+            if body := getattr(response, name):
+                record[name] = base64.b64encode(body).decode()
+    return record
+
+
+def _warc_date() -> str:
+    return f"{datetime.now(timezone.utc):%Y-%m-%dT%H:%M:%SZ}"
+
+
+def _warc_record(
+    warc_type: str,
+    uri: str,
+    content_type: str,
+    block: bytes,
+    headers: Optional[dict] = None,
+    date: Optional[str] = None,
+) -> tuple[str, bytes]:
+    record_id = f"<urn:uuid:{uuid.uuid4()}>"
+    lines = [
+        "WARC/1.1",
+        f"WARC-Type: {warc_type}",
+        f"WARC-Record-ID: {record_id}",
+        f"WARC-Date: {date or _warc_date()}",
+    ]
+    if uri:
+        lines.append(f"WARC-Target-URI: {uri}")
+    lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+    lines += [f"Content-Type: {content_type}", f"Content-Length: {len(block)}"]
+    head = ("\r\n".join(lines) + "\r\n\r\n").encode()
+    return record_id, head + block + b"\r\n\r\n"
+
+
+def _warc(
+    response: parse_pb2.ParseResponse,
+    body: bytes,
+    digest: bytes,
+    date: str,
+    original: Optional[dict] = None,
+) -> tuple[str, bytes]:
+    # The content is what the browser rendered, so it is stored decoded
+    # with transport headers dropped
+    http = [f"HTTP/1.1 {response.status}"]
+    http += [
+        f"{name}: {value}"
+        for name, value in response.headers.items()
+        if name.lower() not in DROP_HEADERS
+    ]
+    http.append(f"Content-Length: {len(body)}")
+    head = ("\r\n".join(http) + "\r\n\r\n").encode()
+    headers = {
+        "WARC-Payload-Digest": f"sha256:{base64.b32encode(digest).decode()}"
+    }
+
+    # Every record is its own gzip member so it can be read on its own
+    if original:
+        # Same body as a record already in the archive, keep the headers
+        # and point at it
+        headers.update(
+            {
+                "WARC-Profile": REVISIT_PROFILE,
+                "WARC-Refers-To": original["record_id"],
+                "WARC-Refers-To-Target-URI": original["url"],
+                "WARC-Refers-To-Date": original["date"],
+            }
+        )
+        record_id, record = _warc_record(
+            "revisit",
+            response.url,
+            "application/http;msgtype=response",
+            head,
+            headers,
+            date,
+        )
+    else:
+        record_id, record = _warc_record(
+            "response",
+            response.url,
+            "application/http;msgtype=response",
+            head + body,
+            headers,
+            date,
+        )
+    members = [gzip.compress(record)]
+    for name, content_type in (
+        ("screenshot", "image/png"),
+        ("pdf", "application/pdf"),
+        ("har", "application/json"),
+    ):
+        if artifact := getattr(response, name):
+            _, record = _warc_record(
+                "resource",
+                f"urn:{name}:{response.url}",
+                content_type,
+                artifact,
+                {"WARC-Concurrent-To": record_id},
+            )
+            members.append(gzip.compress(record))
+    return record_id, b"".join(members)
+
+
+def _warcinfo(filename: str) -> bytes:
+    info = "software: aranea\r\nformat: WARC File Format 1.1\r\n".encode()
+    _, record = _warc_record(
+        "warcinfo",
+        "",
+        "application/warc-fields",
+        info,
+        {"WARC-Filename": filename},
+    )
+    return gzip.compress(record)
+
+
+# Appends gzip members to a file until it reaches max_file_size. Writes
+# are committed in batches: callers wait until their batch is on disk
+class RotatingSink:
+    def __init__(
+        self, kind: str, worker_id: str, path: str = settings.sink.dir
+    ) -> None:
+        self.kind = kind
+        self.worker_id = worker_id
+        self.path = Path(path) / kind
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        self._file: Optional[Path] = None
+        self._size = 0
+        self._sequence = 0
+        self._pending = []
+        self._wakeup = asyncio.Event()
+        self._task = None
+        # Payload digest -> where that body was first written
+        self._seen = OrderedDict()
+
+    def _digest(self, response: parse_pb2.ParseResponse) -> tuple:
+        body = response.content.encode()
+        return body, hashlib.sha256(body).digest()
+
+    def _encode(
+        self,
+        response: parse_pb2.ParseResponse,
+        body: bytes,
+        digest: bytes,
+        original: Optional[dict],
+    ) -> tuple:
+        date = _warc_date()
+
+        if self.kind == "warc":
+            record_id, data = _warc(response, body, digest, date, original)
+            return record_id, date, data
+
+        record = _record(response)
+        record["time"] = time.time()
+        if original:
+            del record["content"]
+            record["revisit"] = {
+                "path": original["path"],
+                "offset": original["offset"],
+            }
+        data = gzip.compress(json.dumps(record).encode() + b"\n")
+        return None, date, data
+
+    def _remember(self, digest: bytes, original: dict) -> None:
+        self._seen[digest] = original
+        while len(self._seen) > settings.sink.dedupe_window:
+            self._seen.popitem(last=False)
+
+    def _rotate(self) -> None:
+        self._sequence += 1
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
+        name = f"{self.worker_id}-{stamp}-{self._sequence:05d}.{self.kind}.gz"
+        self._file = self.path / name
+        self._size = 0
+        if self.kind == "warc":
+            info = _warcinfo(name)
+            self._pending.append((self._file, info, None))
+            self._size += len(info)
+
+    async def write(
+        self, response: parse_pb2.ParseResponse
+    ) -> parse_pb2.SinkReference:
+        body, digest = await asyncio.to_thread(self._digest, response)
+        # The dedupe window is only touched on the event loop
+        original = self._seen.get(digest)
+        record_id, date, data = await asyncio.to_thread(
+            self._encode, response, body, digest, original
+        )
+
+        # Offsets are assigned here, on the event loop, so they match the
+        # order the batch is written in
+        if self._file is None or (
+            self._size + len(data) > settings.sink.max_file_size
+        ):
+            self._rotate()
+        path, offset = self._file, self._size
+        self._size += len(data)
+
+        written = asyncio.get_running_loop().create_future()
+        self._pending.append((path, data, written))
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_periodically())
+        if len(self._pending) >= settings.sink.batch_size:
+            self._wakeup.set()
+        await written
+
+        # Only a body that is on disk can be pointed at
+        if original:
+            if digest in self._seen:
+                self._seen.move_to_end(digest)
+        else:
+            self._remember(
+                digest,
+                {
+                    "path": str(path),
+                    "offset": offset,
+                    "record_id": record_id,
+                    "url": response.url,
+                    "date": date,
+                },
+            )
+
+        return parse_pb2.SinkReference(
+            sink=self.kind,
+            path=str(path),
+            offset=offset,
+            length=len(data),
+            sha256=hashlib.sha256(data).hexdigest(),
+        )
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(),
+                    timeout=settings.sink.flush_interval / 1000,
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        try:
+            await asyncio.to_thread(self._write_batch, batch)
+        except Exception as e:
+            log.error(f"Failed to write {self.kind} batch: {e}")
+            # Offsets past the failure are unknown, start a new file
+            self._file = None
+            self._seen.clear()
+            for _, _, written in batch:
+                if written and not written.done():
+                    written.set_exception(e)
+            return
+
+        for _, _, written in batch:
+            if written and not written.done():
+                written.set_result(None)
+
+    def _write_batch(self, batch: list) -> None:
+        handle = None
+        try:
+            for path, data, _ in batch:
+                if handle is None or handle.name != str(path):
+                    if handle:
+                        self._sync(handle)
+                        handle.close()
+                    handle = open(path, "ab")
+                handle.write(data)
+            self._sync(handle)
+        finally:
+            if handle:
+                handle.close()
+
+    def _sync(self, handle) -> None:
+        handle.flush()
+        os.fsync(handle.fileno())
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+
+
+# Bodies, the content and each artifact, are stored once under
+# objects/, named by their sha256. Each result gets its own gzip JSON
+# record under records/ with the per-request metadata (headers, cookies,
+# timings) and the digests of its bodies
+class BlobSink:
+    kind = "blob"
+
+    def __init__(self, path: str = settings.sink.dir) -> None:
+        self.path = Path(path) / self.kind
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def _put(self, body: bytes) -> str:
+        digest = hashlib.sha256(body).hexdigest()
+        path = self.path / "objects" / digest[:2] / f"{digest}.gz"
+        if not path.exists():
+            atomic_write(path, gzip.compress(body, mtime=0))
+        return digest
+
+    def _store(self, response: parse_pb2.ParseResponse) -> tuple[Path, bytes]:
+        record = _record(response, artifacts=False)
+        record["time"] = time.time()
+        content = record.pop("content").encode()
+        record["bodies"] = {"content": self._put(content)}
+        for name in ARTIFACTS:
+            if body := getattr(response, name):
+                record["bodies"][name] = self._put(body)
+
+        data = gzip.compress(json.dumps(record).encode() + b"\n")
+        name = uuid.uuid4().hex
+        path = self.path / "records" / name[:2] / f"{name}.json.gz"
+        atomic_write(path, data)
+        return path, data
+
+    async def write(
+        self, response: parse_pb2.ParseResponse
+    ) -> parse_pb2.SinkReference:
+        path, data = await asyncio.to_thread(self._store, response)
+        return parse_pb2.SinkReference(
+            sink=self.kind,
+            path=str(path),
+            length=len(data),
+            sha256=hashlib.sha256(data).hexdigest(),
+        )
+
+    async def close(self) -> None:
+        pass
+
+
+class ResultSinks:
+    def __init__(self, worker_id: str) -> None:
+        self.worker_id = worker_id
+        self._sinks = {}
+
+    def get(self, kind: str):
+        if kind not in SINKS:
+            raise ValueError(f"Unknown sink: {kind}")
+        if kind not in self._sinks:
+            self._sinks[kind] = (
+                BlobSink()
+                if kind == "blob"
+                else RotatingSink(kind, self.worker_id)
+            )
+        return self._sinks[kind]
+
+    # Writes the result to the sink and returns the response with the
+    # payload replaced by a reference to it. In every sink the reference
+    # gives the offset, length and sha256 of the stored gzip bytes
+    async def store(
+        self, kind: str, response: parse_pb2.ParseResponse
+    ) -> parse_pb2.ParseResponse:
+        reference = await self.get(kind).write(response)
+        stored = parse_pb2.ParseResponse()
+        stored.CopyFrom(response)
+        stored.content = ""
+        for name in ARTIFACTS:
+            stored.ClearField(name)
+        stored.reference.CopyFrom(reference)
+        return stored
+
+    async def close(self) -> None:
+        for sink in self._sinks.values():
+            await sink.close()
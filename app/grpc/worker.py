@@ -1,43 +1,104 @@
 import argparse
 import asyncio
+import json
 import signal
+import time
+from contextlib import asynccontextmanager
 from typing import Optional
+from urllib.parse import urlsplit
 
 import grpc
 import psutil
 from camoufox.async_api import AsyncCamoufox
-from playwright.async_api import Page
+from playwright.async_api import Page, Playwright, async_playwright
 from playwright.async_api import TimeoutError as PlaywrightTimeoutError
 
 import app.generated.parse_pb2 as parse_pb2
 import app.generated.parse_pb2_grpc as parse_pb2_grpc
 
-from app.config import settings
+from app.config import grpc_options, settings
+from app.diagnostics import LoopMonitor, diagnose
+from app.grpc.artifacts import NetworkRecorder, capture_artifacts
+from app.grpc.cache import ResourceCache
+from app.grpc.fetcher import HttpFetcher, needs_browser
+from app.grpc.fingerprint import Selector, fingerprint, unchanged
+from app.grpc.limiter import AdaptiveLimiter, LimitExceeded
+from app.grpc.proxy import (
+    ProxyPool,
+    is_gateway_error,
+    is_proxy_error,
+    parse_proxy,
+)
+from app.grpc.readiness import ReadinessWaiter, readiness_strategy
+from app.grpc.script import TIMINGS_GLOBAL, compile_script
+from app.grpc.sink import ResultSinks
 from app.logger import log, setup_logger
+from app.transport import write_shared
+
+
+# A request that can't be served as asked, reported as a 400
+class InvalidRequest(ValueError):
+    pass
+
+
+# The worker has no usable browser. Reported as UNAVAILABLE, so the
+# request moves to another worker and this one's breaker counts it
+class BrowserUnavailable(RuntimeError):
+    pass
 
 
 class Worker:
     def __init__(
-        self, worker_id: int, manager_address: str, port: int
+        self,
+        worker_id: int,
+        manager_address: str,
+        port: int,
+        browser_endpoint: Optional[str] = None,
+        socket: Optional[str] = None,
+        shm_dir: Optional[str] = None,
     ) -> None:
         self.worker_id = worker_id
         self.manager_address = manager_address
         self.port = port
+        self.socket = socket
+        self.shm_dir = shm_dir
+        self.browser_endpoint = browser_endpoint
+        self.browser_launch_time = 0.0
 
         self.browser = None
         self.manager_channel = None
         self.manager_stub = None
+        self.fetcher = HttpFetcher()
+        self.sinks = ResultSinks(worker_id)
+        self.resource_cache = (
+            ResourceCache() if settings.cache.enabled else None
+        )
+        self.proxy_pool = (
+            ProxyPool(settings.proxy.proxies)
+            if settings.proxy.proxies
+            else None
+        )
 
         self._status_reporting_task = None
         self._camoufox: Optional[AsyncCamoufox] = None
-        self._active_pages = 0
+        self._playwright: Optional[Playwright] = None
+        self.limiter = AdaptiveLimiter()
+        self.loop_monitor = LoopMonitor()
+        self._in_flight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._draining = False
         self._shutdown_event = asyncio.Event()
-        self._lock = asyncio.Lock()
 
     async def init_browser(self):
         if self.browser:
             return
 
+        started = time.monotonic()
+        if self.browser_endpoint and await self._connect_browser():
+            self.browser_launch_time = time.monotonic() - started
+            return
+
         for attempt in range(settings.browser.max_retries):
             s_msg = f"(attempt {attempt + 1}/{settings.browser.max_retries})"
             try:
@@ -54,6 +115,7 @@ class Worker:
                     timeout=settings.browser.launch_timeout / 1000,
                 )
                 log.info("Browser initialized successfully")
+                self.browser_launch_time = time.monotonic() - started
                 return
             except Exception as e:
                 log.error(f"Failed to initialize browser {s_msg}: {e}")
@@ -62,10 +124,37 @@ class Worker:
                 else:
                     raise
 
+    async def _connect_browser(self) -> bool:
+        # Take over a browser server the manager launched in advance
+        try:
+            log.info(f"Connecting to standby browser {self.browser_endpoint}")
+            self._playwright = await async_playwright().start()
+            self.browser = await self._playwright.firefox.connect(
+                self.browser_endpoint,
+                timeout=settings.browser.launch_timeout,
+            )
+            log.info("Connected to standby browser")
+            return True
+        except Exception as e:
+            log.error(f"Failed to connect to standby browser: {e}")
+            if self._playwright:
+                await self._playwright.stop()
+                self._playwright = None
+            self.browser_endpoint = None
+            return False
+
     async def close_browser(self):
         if not self.browser:
             return
 
+        if self._playwright:
+            log.info("Disconnecting from standby browser")
+            await self.browser.close()
+            await self._playwright.stop()
+            self.browser = None
+            self._playwright = None
+            return
+
         log.info("Closing browser")
         try:
             await asyncio.wait_for(
@@ -89,7 +178,12 @@ class Worker:
         log.info(f"Connected to manager at {self.manager_address}")
 
         registration = parse_pb2.WorkerRegistration(
-            worker_id=self.worker_id, host="localhost", port=self.port
+            worker_id=self.worker_id,
+            host="localhost",
+            port=self.port,
+            startup_time=time.time() - psutil.Process().create_time(),
+            browser_launch_time=self.browser_launch_time,
+            address=f"unix:{self.socket}" if self.socket else "",
         )
         log.info(f"Registering with manager: {registration}")
         response = await self.manager_stub.RegisterWorker(registration)
@@ -109,20 +203,33 @@ class Worker:
             try:
                 status = (
                     parse_pb2.HealthCheckStatus.OK
-                    if self.browser and self.browser.is_connected()
+                    if self.browser
+                    and self.browser.is_connected()
+                    and not self._draining
                     else parse_pb2.HealthCheckStatus.NOT_OK
                 )
                 log.info(f"Worker: {self.worker_id} Status: {status}")
-                cpu_usage = psutil.cpu_percent(interval=0.1)
+                # cpu_percent sleeps for the interval, keep it off the loop
+                cpu_usage = await asyncio.to_thread(psutil.cpu_percent, 0.1)
                 memory_usage = psutil.virtual_memory().percent
 
                 report = parse_pb2.StatusReport(
                     worker_id=self.worker_id,
                     port=self.port,
                     status=status,
-                    active_pages=self._active_pages,
+                    active_pages=self.limiter.in_flight,
+                    page_limit=self.limiter.current,
+                    loop_lag=self.loop_monitor.max_lag,
                     cpu_usage=cpu_usage,
                     memory_usage=memory_usage,
+                    cache_hits=(
+                        self.resource_cache.hits if self.resource_cache else 0
+                    ),
+                    cache_misses=(
+                        self.resource_cache.misses
+                        if self.resource_cache
+                        else 0
+                    ),
                 )
 
                 await self.manager_stub.ReportStatus(report)
@@ -132,74 +239,299 @@ class Worker:
 
             await asyncio.sleep(10)  # Report every 10 seconds
 
-    async def _acquire_page(self):
-        async with self._lock:
-            if self._active_pages >= settings.browser.max_pages:
-                raise RuntimeError("Maximum number of pages reached")
-            self._active_pages += 1
-
-    async def _release_page(self):
-        async with self._lock:
-            self._active_pages -= 1
-
-    async def Parse(self, request, context):
+    @asynccontextmanager
+    async def _page_slot(self):
         log.info("Acquiring page")
-        page = None
+        self.limiter.acquire()
+        started = time.monotonic()
         try:
-            if self._shutdown_event.is_set():
-                context.set_code(grpc.StatusCode.UNAVAILABLE)
-                context.set_details("Server is shutting down")
-                return parse_pb2.ParseResponse()
-
-            await self._acquire_page()
             if not self.browser:
-                await self.init_browser()
+                try:
+                    await self.init_browser()
+                except Exception as e:
+                    raise BrowserUnavailable(
+                        f"Browser failed to start: {e}"
+                    ) from e
+            yield
+        except (PlaywrightTimeoutError, asyncio.TimeoutError):
+            # A timeout counts as congestion, other failures are the page's
+            self.limiter.release(congested=True)
+            raise
+        except BaseException:
+            self.limiter.release()
+            raise
+        self.limiter.release(time.monotonic() - started)
 
-            proxy = None
-            if request.proxy:
+    async def Parse(self, request, context):
+        if self._draining or self._shutdown_event.is_set():
+            context.set_code(grpc.StatusCode.UNAVAILABLE)
+            # The dispatcher matches these details to tell a drain from
+            # a failure
+            context.set_details("Worker is draining")
+            return parse_pb2.ParseResponse()
+
+        self._in_flight += 1
+        self._idle.clear()
+        try:
+            response = await self._parse(request)
+            if response.content and (
+                request.fingerprint
+                or request.simhash
+                or request.HasField("previous")
+            ):
+                await self._fingerprint(request, response)
+            if request.sink and response.content:
+                response = await self._store(request, response)
+            if self.shm_dir:
                 try:
-                    creds, server = request.proxy.split("@")
-                    username, password = creds.split(":")
-                    proxy = {
-                        "server": server,
-                        "username": username,
-                        "password": password,
-                    }
-                except ValueError as e:
-                    raise ValueError("Invalid proxy format") from e
+                    response = await asyncio.to_thread(
+                        write_shared, response, self.worker_id, self.shm_dir
+                    )
+                except Exception as e:
+                    log.error(f"Failed to share payload: {e}")
+                    return parse_pb2.ParseResponse(
+                        status=518,
+                        content="",
+                        error=f"Failed to share payload: {e}",
+                        headers={},
+                        cookies=[],
+                        url=request.url,
+                    )
+            return response
+        except LimitExceeded as e:
+            # Lets the manager retry on a worker with room to spare
+            context.set_code(grpc.StatusCode.RESOURCE_EXHAUSTED)
+            context.set_details(str(e))
+            return parse_pb2.ParseResponse()
+        except BrowserUnavailable as e:
+            log.error(f"Browser unavailable: {e}")
+            context.set_code(grpc.StatusCode.UNAVAILABLE)
+            context.set_details(str(e))
+            return parse_pb2.ParseResponse()
+        finally:
+            self._in_flight -= 1
+            if not self._in_flight:
+                self._idle.set()
+
+    async def _fingerprint(self, request, response):
+        response.fingerprint.CopyFrom(
+            await asyncio.to_thread(
+                fingerprint,
+                response.content,
+                tuple(request.ignore),
+                request.simhash,
+            )
+        )
+        if request.HasField("previous") and unchanged(
+            response.fingerprint, request.previous
+        ):
+            # Nothing new to send or store
+            response.unchanged = True
+            response.content = ""
+
+    async def _store(self, request, response):
+        try:
+            return await self.sinks.store(request.sink, response)
+        except Exception as e:
+            log.error(f"Failed to store {request.url} in {request.sink}: {e}")
+            return parse_pb2.ParseResponse(
+                status=518,
+                content="",
+                error=f"sink: {e}",
+                headers={},
+                cookies=[],
+                url=request.url,
+            )
+
+    async def _parse(self, request):
+        try:
+            try:
+                if request.sink:
+                    self.sinks.get(request.sink)
+                for selector in request.ignore:
+                    Selector(selector)
+                if (
+                    request.HasField("ready")
+                    or settings.browser.ready_strategy
+                ):
+                    readiness_strategy(request.ready)
+            except ValueError as e:
+                raise InvalidRequest(str(e)) from e
+
+            mode = request.mode or "browser"
+            if mode not in ("browser", "http", "auto"):
+                raise InvalidRequest(f"Unknown mode: {mode}")
+            # Only a browser can run actions or capture artifacts
+            needs_page = bool(
+                request.actions
+                or request.script
+                or request.artifacts.screenshot
+                or request.artifacts.pdf
+                or request.artifacts.har
+            )
+            if mode == "auto" and needs_page:
+                mode = "browser"
+            if mode == "http" and needs_page:
+                raise InvalidRequest(
+                    "Actions, scripts and artifacts require browser mode"
+                )
+
+            if mode == "browser":
+                async with self._page_slot():
+                    return await self._with_proxy(request, self._render)
+
+            if mode == "http":
+                return await self._with_proxy(request, self.fetcher.fetch)
+
+            # In auto mode the browser gets a go at whatever the plain
+            # fetch couldn't handle, failures included
+            try:
+                response = await self._with_proxy(request, self.fetcher.fetch)
+            except Exception as e:
+                reason = f"fetch failed ({e})"
+            else:
+                reason = needs_browser(response)
+                if reason is None:
+                    return response
+
+            log.info(f"Falling back to browser for {request.url}: {reason}")
+            async with self._page_slot():
+                return await self._with_proxy(request, self._render)
+
+        except (LimitExceeded, BrowserUnavailable):
+            raise
+        except InvalidRequest as e:
+            return parse_pb2.ParseResponse(
+                status=400,
+                content="",
+                error=str(e),
+                headers={},
+                cookies=[],
+                url=request.url,
+            )
+        except (PlaywrightTimeoutError, asyncio.TimeoutError) as e:
+            log.error(f"TimeoutError: {e}")
+            return parse_pb2.ParseResponse(
+                status=418,
+                content="",
+                error=str(e),
+                headers={},
+                cookies=[],
+                url=request.url,
+            )
+        except Exception as e:
+            log.error(f"Exception: {e}")
+            return parse_pb2.ParseResponse(
+                status=518,
+                content="",
+                error=str(e),
+                headers={},
+                cookies=[],
+                url=request.url,
+            )
+
+    async def _with_proxy(self, request, render):
+        if request.proxy or not self.proxy_pool:
+            proxy = parse_proxy(request.proxy) if request.proxy else None
+            return await render(request, proxy)
+
+        key = request.session or urlsplit(request.url).hostname
+        tried = []
+        for attempt in range(settings.proxy.max_attempts):
+            proxy = await self.proxy_pool.acquire(key, exclude=tuple(tried))
+            tried.append(proxy)
+            started = time.monotonic()
+            try:
+                response = await render(request, proxy.settings)
+            except (PlaywrightTimeoutError, asyncio.TimeoutError):
+                self.proxy_pool.report_failure(proxy)
+                raise
+            except Exception as e:
+                # The proxy did its job when the target is what failed, so
+                # it isn't held against it and another proxy won't help
+                if is_gateway_error(e) or not is_proxy_error(e):
+                    raise
+                log.warning(
+                    f"Proxy {proxy} failed (attempt {attempt + 1}/"
+                    f"{settings.proxy.max_attempts}): {e}"
+                )
+                self.proxy_pool.report_failure(proxy, fatal=True)
+                if attempt == settings.proxy.max_attempts - 1:
+                    raise
+                continue
 
+            if response.status == 407:
+                self.proxy_pool.report_failure(proxy, fatal=True)
+            else:
+                self.proxy_pool.report_success(
+                    proxy, time.monotonic() - started
+                )
+            return response
+
+    async def _render(self, request, proxy: Optional[dict]):
+        page = None
+        try:
             log.info(
                 f"Setting proxy: {proxy} and extra headers: {request.headers}"
             )
-            page = await self.browser.new_page(
-                proxy=proxy,
-                extra_http_headers=request.headers,
-            )
+            if not self.browser.is_connected():
+                raise BrowserUnavailable("Browser is disconnected")
+            try:
+                page = await self.browser.new_page(
+                    proxy=proxy,
+                    extra_http_headers=request.headers,
+                )
+            except Exception as e:
+                # With the browser still up it was the request's settings
+                if self.browser.is_connected():
+                    raise
+                raise BrowserUnavailable(f"Failed to open a page: {e}") from e
 
             log.info(f"Page created: {page}")
 
-            if request.block:
+            if request.block or self.resource_cache:
                 await page.route(
                     "**/*",
-                    lambda route, req: asyncio.create_task(
-                        route.abort()
-                        if any(req.url.endswith(ext) for ext in request.block)
-                        else route.continue_()
-                    ),
+                    lambda route: self._handle_route(route, request.block),
                 )
 
+            recorder = None
+            if request.artifacts.har:
+                recorder = NetworkRecorder(page)
+                recorder.attach()
+
+            waiter = None
+            if request.HasField("ready") or settings.browser.ready_strategy:
+                waiter = ReadinessWaiter(page, request.ready)
+                waiter.attach()
+
             log.info(f"Going to URL: {request.url}")
             response = await page.goto(
                 request.url,
                 timeout=request.timeout or settings.browser.timeout,
-                wait_until=request.load or "networkidle",
+                wait_until=request.load
+                or ("domcontentloaded" if waiter else "networkidle"),
             )
+            partial = waiter is not None and not await waiter.wait()
 
             if request.actions:
                 for action in request.actions:
                     await self.execute_action(page, action)
 
+            script = {}
+            if request.script:
+                script = await self.execute_script(
+                    page,
+                    request.script,
+                    (request.timeout or settings.browser.timeout) / 1000,
+                )
+
             content = await page.content()
+            artifacts, errors = await capture_artifacts(
+                page, request.artifacts, recorder
+            )
+            if script.get("error"):
+                errors.insert(0, script["error"])
             headers = await response.all_headers() if response else {}
             cookies = [
                 parse_pb2.Cookie(
@@ -218,36 +550,27 @@ class Worker:
             return parse_pb2.ParseResponse(
                 status=response.status,
                 content=content,
-                error="",
+                error="; ".join(errors),
                 headers=headers,
                 cookies=cookies,
                 url=page.url,
-            )
-
-        except PlaywrightTimeoutError as e:
-            log.error(f"TimeoutError: {e}")
-            return parse_pb2.ParseResponse(
-                status=418,
-                content="",
-                error=str(e),
-                headers={},
-                cookies=[],
-                url=request.url,
-            )
-        except Exception as e:
-            log.error(f"Exception: {e}")
-            return parse_pb2.ParseResponse(
-                status=518,
-                content="",
-                error=str(e),
-                headers={},
-                cookies=[],
-                url=request.url,
+                partial=partial or script.get("partial", False),
+                timings=script.get("timings", []),
+                script_result=json.dumps(script["result"]) if script else "",
+                **artifacts,
             )
         finally:
             if page:
                 await page.close()
-            await self._release_page()
+
+    async def _handle_route(self, route, block):
+        req = route.request
+        if block and any(req.url.endswith(ext) for ext in block):
+            await route.abort()
+        elif self.resource_cache and self.resource_cache.accepts(req):
+            await self.resource_cache.handle(route)
+        else:
+            await route.continue_()
 
     async def execute_action(self, page: Page, action: parse_pb2.Action):
         if coro := getattr(page, action.func, None):
@@ -262,33 +585,102 @@ class Worker:
             )
             log.info(f"Action {action.func} executed successfully")
 
+    async def execute_script(
+        self, page: Page, source: str, timeout: float
+    ) -> dict:
+        js = compile_script(source)
+        log.info(f"Executing script on {page.url}")
+        try:
+            result = await asyncio.wait_for(page.evaluate(js), timeout)
+        except asyncio.TimeoutError:
+            # Keep what the finished steps measured and return the page as
+            # it is now
+            try:
+                timings = await asyncio.wait_for(
+                    page.evaluate(f"() => window.{TIMINGS_GLOBAL} || []"), 1
+                )
+            except Exception:
+                timings = []
+            result = {
+                "timings": timings,
+                "result": None,
+                "error": f"Script timed out after {timeout:g}s",
+                "partial": True,
+            }
+        if result["error"]:
+            log.warning(f"Script failed: {result['error']}")
+        result["timings"] = [
+            parse_pb2.StepTiming(**timing) for timing in result["timings"]
+        ]
+        return result
+
+    async def Drain(self, request, context):
+        timeout = request.timeout or settings.registry.drain_timeout
+        drained = await self.drain(timeout / 1000)
+        return parse_pb2.DrainResponse(
+            drained=drained, in_flight=self._in_flight
+        )
+
+    async def Diagnose(self, request, context):
+        try:
+            data = await diagnose(request.action, request.duration)
+        except ValueError as e:
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(e))
+            return parse_pb2.DiagnoseResponse()
+        return parse_pb2.DiagnoseResponse(data=data.encode())
+
+    # Stops taking new requests and waits for the in-flight ones
+    async def drain(self, timeout: float) -> bool:
+        if not self._draining:
+            log.info(
+                f"Draining worker {self.worker_id}, "
+                f"{self._in_flight} requests in flight"
+            )
+        self._draining = True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            log.warning(
+                f"Worker {self.worker_id} still has {self._in_flight} "
+                f"requests in flight after {timeout}s"
+            )
+            return False
+
     async def shutdown(self, server=None):
         log.info("Initiating graceful shutdown")
         self._shutdown_event.set()
-        await server.stop(grace=5)
+        await self.drain(settings.registry.drain_timeout / 1000)
+        await server.stop(grace=settings.server.shutdown_grace / 1000)
         await self.close_browser()
+        await self.fetcher.close()
+        await self.sinks.close()
+        await self.loop_monitor.stop()
+        if self.resource_cache:
+            self.resource_cache.close()
 
     async def serve(self):
-        server = grpc.aio.server()
+        server = grpc.aio.server(options=grpc_options())
         parse_pb2_grpc.add_ParserWorkerServicer_to_server(self, server)
-        server.add_insecure_port(f"[::]:{self.port}")
+        server.add_insecure_port(
+            f"unix:{self.socket}" if self.socket else f"[::]:{self.port}"
+        )
 
         loop = asyncio.get_running_loop()
         for sig in (signal.SIGTERM, signal.SIGINT):
-            loop.add_signal_handler(
-                sig, lambda: asyncio.create_task(self.shutdown(server))
-            )
+            loop.add_signal_handler(sig, self._shutdown_event.set)
 
         await server.start()
+        self.loop_monitor.start()
         log.info(f"gRPC сервер запущен на порту {self.port}")
 
         try:
-            await server.wait_for_termination()
+            await self._shutdown_event.wait()
         except asyncio.CancelledError:
             log.info("Server shutdown initiated")
         finally:
             await self.shutdown(server)
-            await server.stop(grace=5)
 
 
 def parse_args():
@@ -301,18 +693,42 @@ def parse_args():
         default=settings.server.manager_address,
         help="Manager address",
     )
+    parser.add_argument(
+        "--browser-endpoint",
+        type=str,
+        default=None,
+        help="Websocket endpoint of a pre-launched browser server",
+    )
+    parser.add_argument(
+        "--socket",
+        type=str,
+        default=None,
+        help="Unix socket path to serve on instead of the port",
+    )
+    parser.add_argument(
+        "--shm-dir",
+        type=str,
+        default=None,
+        help="Directory to pass large payloads to the manager through",
+    )
     return parser.parse_args()
 
 
-async def main():
-    setup_logger()
-
-    args = parse_args()
-
+async def run(
+    worker_id,
+    port,
+    manager_address,
+    browser_endpoint=None,
+    socket=None,
+    shm_dir=None,
+):
     worker = Worker(
-        worker_id=args.id,
-        manager_address=args.manager,
-        port=args.port,
+        worker_id=worker_id,
+        manager_address=manager_address,
+        port=port,
+        browser_endpoint=browser_endpoint,
+        socket=socket,
+        shm_dir=shm_dir,
     )
 
     await worker.init_browser()
@@ -320,5 +736,42 @@ async def main():
     await worker.serve()
 
 
+# Entry point for workers forked from the manager's fork server
+def start(
+    worker_id,
+    port,
+    manager_address,
+    browser_endpoint=None,
+    socket=None,
+    shm_dir=None,
+):
+    setup_logger()
+    asyncio.run(
+        run(
+            worker_id,
+            port,
+            manager_address,
+            browser_endpoint,
+            socket,
+            shm_dir,
+        )
+    )
+
+
+async def main():
+    setup_logger()
+
+    args = parse_args()
+
+    await run(
+        args.id,
+        args.port,
+        args.manager,
+        args.browser_endpoint,
+        args.socket,
+        args.shm_dir,
+    )
+
+
 if __name__ == "__main__":
     asyncio.run(main())
@@ -17,7 +17,14 @@ class ParserManagerServicer(parse_pb2_grpc.ParserManagerServicer):
         host = request.host
 
         log.info(f"Worker {worker_id} registering from {host}:{port}")
-        await self.worker_registry.register_worker(worker_id, host, port)
+        await self.worker_registry.register_worker(
+            worker_id,
+            host,
+            port,
+            request.startup_time,
+            request.browser_launch_time,
+            request.address,
+        )
         return parse_pb2.RegistrationResponse(
             success=True, message=f"Worker {worker_id} registered successfully"
         )
@@ -34,6 +41,10 @@ class ParserManagerServicer(parse_pb2_grpc.ParserManagerServicer):
             request.active_pages,
             request.cpu_usage,
             request.memory_usage,
+            request.cache_hits,
+            request.cache_misses,
+            request.page_limit,
+            request.loop_lag,
         )
 
         return parse_pb2.StatusAck(received=True, message="Status updated")
@@ -42,9 +53,13 @@ class ParserManagerServicer(parse_pb2_grpc.ParserManagerServicer):
 async def start_manager_server(address):
     server = grpc.aio.server()
     worker_registry = WorkerRegistry()
+    worker_registry.start_monitor()
+    worker_registry.start_prewarm()
     servicer = ParserManagerServicer(worker_registry)
     parse_pb2_grpc.add_ParserManagerServicer_to_server(servicer, server)
     server.add_insecure_port(address)
+    if worker_registry.sockets:
+        server.add_insecure_port(worker_registry.manager_address)
     await server.start()
     log.info(f"Manager server started on: {address}")
     return server, worker_registry
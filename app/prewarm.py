@@ -0,0 +1,201 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import re
+import signal
+import subprocess
+import sys
+import time
+from multiprocessing import forkserver
+from typing import Optional
+
+from app.config import settings
+from app.logger import log
+
+# Imported once by the fork server, so forked workers start with grpc,
+# camoufox, playwright and settings already loaded. "__main__" keeps the
+# children from re-running the manager's entry module
+PRELOAD = ["__main__", "app.grpc.worker"]
+
+LAUNCH_SERVER = (
+    "import json, sys; from camoufox.server import launch_server; "
+    "launch_server(**json.loads(sys.argv[1]))"
+)
+WS_ENDPOINT_RE = re.compile(rb"ws://[^\s\x1b]+")
+
+
+def _start_worker(
+    worker_id, port, manager_address, browser_endpoint, socket, shm_dir
+):
+    from app.grpc.worker import start
+
+    start(worker_id, port, manager_address, browser_endpoint, socket, shm_dir)
+
+
+# Gives a forked worker the parts of the Popen interface the registry uses
+class WorkerProcess:
+    def __init__(self, process: multiprocessing.Process) -> None:
+        self._process = process
+
+    @property
+    def pid(self) -> int:
+        return self._process.pid
+
+    @property
+    def returncode(self) -> Optional[int]:
+        return self._process.exitcode
+
+    def poll(self) -> Optional[int]:
+        return self._process.exitcode
+
+    def terminate(self) -> None:
+        self._process.terminate()
+
+    def kill(self) -> None:
+        self._process.kill()
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[int]:
+        self._process.join(timeout)
+        if self._process.exitcode is None:
+            raise subprocess.TimeoutExpired(f"worker {self.pid}", timeout)
+        return self._process.exitcode
+
+
+class WorkerForkServer:
+    def __init__(self) -> None:
+        self._ctx = multiprocessing.get_context("forkserver")
+        self._ctx.set_forkserver_preload(PRELOAD)
+
+    def start(self) -> None:
+        started = time.monotonic()
+        forkserver.ensure_running()
+        log.info(
+            f"Worker fork server ready in {time.monotonic() - started:.2f}s"
+        )
+
+    def spawn(
+        self,
+        worker_id: str,
+        port: int,
+        manager_address: str,
+        browser_endpoint: Optional[str] = None,
+        socket: Optional[str] = None,
+        shm_dir: Optional[str] = None,
+    ) -> WorkerProcess:
+        process = self._ctx.Process(
+            target=_start_worker,
+            args=(
+                worker_id,
+                port,
+                manager_address,
+                browser_endpoint,
+                socket,
+                shm_dir,
+            ),
+            name=worker_id,
+        )
+        process.start()
+        return WorkerProcess(process)
+
+
+class StandbyBrowser:
+    def __init__(self, process, endpoint: str, launch_time: float) -> None:
+        self.process = process
+        self.endpoint = endpoint
+        self.launch_time = launch_time
+
+    @property
+    def alive(self) -> bool:
+        return self.process.returncode is None
+
+    def kill(self) -> None:
+        if not self.alive:
+            return
+        # launch_server runs node in a child process, take the whole group
+        try:
+            os.killpg(self.process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+
+class BrowserPool:
+    def __init__(self, size: int = settings.spawn.standby_browsers) -> None:
+        self.size = size
+        self._ready: asyncio.Queue[StandbyBrowser] = asyncio.Queue()
+        self._tasks = set()
+
+    def start(self) -> None:
+        for _ in range(self.size):
+            self._refill()
+
+    def _refill(self) -> None:
+        task = asyncio.create_task(self._launch())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _launch(self) -> None:
+        options = {
+            "humanize": settings.browser.humanize,
+            "headless": settings.browser.headless,
+            "locale": settings.browser.locale,
+            "block_webrtc": settings.browser.block_webrtc,
+            "geoip": settings.browser.geoip,
+        }
+        started = time.monotonic()
+        process = await asyncio.create_subprocess_exec(
+            sys.executable,
+            "-c",
+            LAUNCH_SERVER,
+            json.dumps(options),
+            stdout=asyncio.subprocess.PIPE,
+            start_new_session=True,
+        )
+        try:
+            endpoint = await asyncio.wait_for(
+                self._read_endpoint(process),
+                timeout=settings.spawn.browser_launch_timeout / 1000,
+            )
+        except Exception as e:
+            log.error(f"Failed to launch standby browser: {e}")
+            StandbyBrowser(process, "", 0).kill()
+            return
+
+        browser = StandbyBrowser(
+            process, endpoint, time.monotonic() - started
+        )
+        log.info(
+            f"Standby browser ready at {endpoint} "
+            f"in {browser.launch_time:.2f}s"
+        )
+        self._ready.put_nowait(browser)
+        # Keep draining the server output so it never blocks on a full pipe
+        drain = asyncio.create_task(self._drain(process.stdout))
+        self._tasks.add(drain)
+        drain.add_done_callback(self._tasks.discard)
+
+    async def _read_endpoint(self, process) -> str:
+        while line := await process.stdout.readline():
+            if match := WS_ENDPOINT_RE.search(line):
+                return match.group().decode()
+        raise RuntimeError(
+            f"Browser server exited with code {await process.wait()}"
+        )
+
+    async def _drain(self, stream) -> None:
+        while await stream.read(65536):
+            pass
+
+    def acquire(self) -> Optional[StandbyBrowser]:
+        while not self._ready.empty():
+            browser = self._ready.get_nowait()
+            self._refill()
+            if browser.alive:
+                return browser
+        return None
+
+    async def close(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        while not self._ready.empty():
+            self._ready.get_nowait().kill()
@@ -1,14 +1,77 @@
 import asyncio
 import subprocess
-from datetime import datetime
+import time
+from collections import deque
+from datetime import datetime, timedelta
 
 import grpc
 
 import app.generated.parse_pb2 as parse_pb2
 import app.generated.parse_pb2_grpc as parse_pb2_grpc
 
-from app.config import settings
+from app.config import grpc_options, settings
 from app.logger import log
+from app.prewarm import BrowserPool, WorkerForkServer
+from app.transport import SharedDirectory, SocketDirectory
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self):
+        self.state = self.CLOSED
+        self.outcomes = deque(maxlen=settings.registry.breaker_window)
+        self._opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+
+    @property
+    def error_rate(self):
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def allow(self):
+        if self.state == self.CLOSED:
+            return True
+        cooldown = settings.registry.breaker_cooldown / 1000
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < cooldown:
+                return False
+            self.state = self.HALF_OPEN
+        # Let a single probe through while half open, unless the probe got
+        # lost (e.g. cancelled as a hedging loser)
+        return (
+            not self._probing
+            or time.monotonic() - self._probe_started > cooldown
+        )
+
+    def on_dispatch(self):
+        if self.state == self.HALF_OPEN:
+            self._probing = True
+            self._probe_started = time.monotonic()
+
+    def record(self, ok):
+        self.outcomes.append(ok)
+        if self.state == self.HALF_OPEN:
+            self._probing = False
+            if ok:
+                self.state = self.CLOSED
+                self.outcomes.clear()
+            else:
+                self._open()
+        elif (
+            self.state == self.CLOSED
+            and len(self.outcomes) >= settings.registry.breaker_min_requests
+            and self.error_rate >= settings.registry.breaker_error_rate
+        ):
+            self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
 
 
 class WorkerRegistry:
@@ -18,11 +81,44 @@ class WorkerRegistry:
         self._lock = asyncio.Lock()
         self._worker_id_counter = 0
         self._base_port = 50051
+        self._monitor_task = None
+        self._restarting = False
+        self.history = {}
+        self._subscribers = set()
+        self.fork_server = (
+            WorkerForkServer() if settings.spawn.zygote else None
+        )
+        self.browser_pool = (
+            BrowserPool() if settings.spawn.standby_browsers else None
+        )
+        self.sockets = (
+            SocketDirectory() if settings.transport.unix_sockets else None
+        )
+        self.shared = (
+            SharedDirectory() if settings.transport.shared_memory else None
+        )
+        # Where spawned workers reach the manager
+        self.manager_address = (
+            f"unix:{self.sockets.allocate('manager')}"
+            if self.sockets
+            else settings.server.manager_address
+        )
+
+    def start_prewarm(self):
+        if self.fork_server:
+            self.fork_server.start()
+        if self.browser_pool:
+            self.browser_pool.start()
+
+    async def stop_prewarm(self):
+        if self.browser_pool:
+            await self.browser_pool.close()
 
     async def spawn_worker(self):
         async with self._lock:
             worker_id = f"worker-{self._worker_id_counter}"
-            port = self._base_port + self._worker_id_counter
+            socket = self.sockets.allocate(worker_id) if self.sockets else None
+            port = 0 if socket else self._base_port + self._worker_id_counter
             self._worker_id_counter += 1
 
             cmd = [
@@ -33,80 +129,361 @@ class WorkerRegistry:
                 "--port",
                 str(port),
                 "--manager",
-                settings.server.manager_address,
+                self.manager_address,
             ]
+            if socket:
+                cmd += ["--socket", socket]
+            shm_dir = str(self.shared.path) if self.shared else None
+            if shm_dir:
+                cmd += ["--shm-dir", shm_dir]
 
-            log.info(f"Spawning worker {worker_id} on port {port}...")
-            proc = subprocess.Popen(cmd)
+            browser = (
+                self.browser_pool.acquire() if self.browser_pool else None
+            )
+            endpoint = browser.endpoint if browser else None
+            if endpoint:
+                cmd += ["--browser-endpoint", endpoint]
 
-            self.processes[worker_id] = {
+            log.info(
+                f"Spawning worker {worker_id} on {socket or f'port {port}'}..."
+            )
+            if self.fork_server:
+                proc = self.fork_server.spawn(
+                    worker_id,
+                    port,
+                    self.manager_address,
+                    endpoint,
+                    socket,
+                    shm_dir,
+                )
+            else:
+                proc = subprocess.Popen(cmd)
+
+            process_info = {
                 "process": proc,
                 "port": port,
                 "spawn_time": datetime.now(),
                 "registered": False,
+                "browser": browser,
+                "socket": socket,
             }
+            self.processes[worker_id] = process_info
 
-            for _ in range(30):  # 30 seconds timeout
-                await asyncio.sleep(1)
-                if worker_id in self.workers and self.workers[worker_id].get(
-                    "registered", False
-                ):
-                    self.processes[worker_id]["registered"] = True
-                    return {"worker_id": worker_id, "port": port}
+        # Registration and heartbeats take the lock, so wait without it.
+        # Poll often, a pre-warmed worker registers in well under a second
+        for _ in range(settings.spawn.register_timeout // 100):
+            await asyncio.sleep(0.1)
+            if worker_id in self.workers and self.workers[worker_id].get(
+                "registered", False
+            ):
+                process_info["registered"] = True
+                return {
+                    "worker_id": worker_id,
+                    "port": port,
+                    "socket": socket,
+                }
+            if proc.poll() is not None:
+                async with self._lock:
+                    self._release_if_current(worker_id, process_info)
+                raise RuntimeError(
+                    f"Worker {worker_id} exited with code "
+                    f"{proc.returncode} before registering"
+                )
 
-            proc.terminate()
-            try:
-                proc.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                proc.kill()
+        proc.terminate()
+        try:
+            await asyncio.to_thread(proc.wait, 5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        async with self._lock:
+            self._release_if_current(worker_id, process_info)
+
+        raise RuntimeError(
+            f"Worker {worker_id} failed to register within timeout"
+        )
+
+    # For workers that started draining on their own, e.g. on SIGTERM
+    def mark_draining(self, worker_id):
+        info = self.workers.get(worker_id)
+        if info and not info["draining"]:
+            info["draining"] = True
+            self.publish("worker", self.describe_worker(worker_id))
 
-            raise RuntimeError(
-                f"Worker {worker_id} failed to register within timeout"
+    async def drain_worker(self, worker_id, timeout=None):
+        if worker_id not in self.workers:
+            raise KeyError(f"Worker {worker_id} not found")
+
+        timeout = timeout or settings.registry.drain_timeout
+        info = self.workers[worker_id]
+        info["draining"] = True
+        self.publish("worker", self.describe_worker(worker_id))
+        log.info(f"Draining worker {worker_id}")
+
+        try:
+            response = await info["stub"].Drain(
+                parse_pb2.DrainRequest(timeout=timeout),
+                timeout=timeout / 1000 + 5,
             )
+        except grpc.aio.AioRpcError as e:
+            log.warning(f"Failed to drain worker {worker_id}: {e.details()}")
+            return {"worker_id": worker_id, "drained": False, "in_flight": -1}
+
+        return {
+            "worker_id": worker_id,
+            "drained": response.drained,
+            "in_flight": response.in_flight,
+        }
+
+    async def diagnose_worker(self, worker_id, action, duration=None):
+        if worker_id not in self.workers:
+            raise KeyError(f"Worker {worker_id} not found")
+
+        response = await self.workers[worker_id]["stub"].Diagnose(
+            parse_pb2.DiagnoseRequest(action=action, duration=duration or 0),
+            timeout=settings.diagnostics.profile_max_duration / 1000 + 10,
+        )
+        return response.data
+
+    async def kill_worker(self, worker_id, drain=True):
+        if drain and worker_id in self.workers:
+            await self.drain_worker(worker_id)
 
-    async def kill_worker(self, worker_id):
         async with self._lock:
             if worker_id not in self.processes:
                 raise KeyError(f"Worker {worker_id} not found")
 
             process_info = self.processes[worker_id]
+            process_info["stopping"] = True
             process = process_info["process"]
             process.terminate()
 
+        # Waiting in a thread and without the lock keeps the manager
+        # serving while the worker exits
+        try:
+            await asyncio.to_thread(process.wait, 5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            await asyncio.to_thread(process.wait, 1)
+
+        async with self._lock:
+            await self._remove_worker(worker_id)
+            self._release_if_current(worker_id, process_info)
+        return {"worker_id": worker_id, "status": "terminated"}
+
+    # The entry may already be gone, or replaced, if check_workers or
+    # another kill got to it while the lock was released
+    def _release_if_current(self, worker_id, process_info):
+        if self.processes.get(worker_id) is process_info:
+            self._release_process(worker_id)
+
+    def _release_process(self, worker_id):
+        process_info = self.processes.pop(worker_id)
+        if process_info.get("browser"):
+            process_info["browser"].kill()
+        if process_info.get("socket"):
+            self.sockets.release(process_info["socket"])
+
+    def close_transport(self):
+        if self.sockets:
+            self.sockets.close()
+        if self.shared:
+            self.shared.close()
+
+    async def _remove_worker(self, worker_id):
+        if worker_id in self.workers:
+            if "stub" in self.workers[worker_id] and hasattr(
+                self.workers[worker_id]["stub"], "_channel"
+            ):
+                await self.workers[worker_id]["stub"]._channel.close()
+            del self.workers[worker_id]
+            self.history.pop(worker_id, None)
+            self.publish("removed", {"worker_id": worker_id})
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=settings.dashboard.subscriber_queue)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+
+    def is_subscribed(self, queue):
+        return queue in self._subscribers
+
+    def publish(self, event, data):
+        for queue in list(self._subscribers):
             try:
-                process.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                process.kill()
-                process.wait(timeout=1)
+                queue.put_nowait((event, data))
+            except asyncio.QueueFull:
+                # A dashboard that can't keep up gets dropped and will
+                # reconnect for a fresh snapshot
+                self._subscribers.discard(queue)
 
-            if worker_id in self.workers:
-                if "stub" in self.workers[worker_id] and hasattr(
-                    self.workers[worker_id]["stub"], "_channel"
+    def describe_worker(self, worker_id):
+        info = self.workers[worker_id]
+        return {
+            "id": worker_id,
+            "host": info["host"],
+            "port": info["port"],
+            "address": info["address"],
+            "status": info["status"],
+            "last_report": info["last_report"].isoformat(),
+            "active_pages": info["active_pages"],
+            "page_limit": info["page_limit"],
+            "loop_lag": info["loop_lag"],
+            "cpu_usage": info["cpu_usage"],
+            "memory_usage": info["memory_usage"],
+            "cache_hits": info["cache_hits"],
+            "cache_misses": info["cache_misses"],
+            "circuit": info["breaker"].state,
+            "draining": info["draining"],
+            "error_rate": info["breaker"].error_rate,
+            "latency": self._latency(info),
+            "startup_time": info["startup_time"],
+            "browser_launch_time": info["browser_launch_time"],
+            "spawn_duration": info["spawn_duration"],
+        }
+
+    def _latency(self, info):
+        if not info["latencies"]:
+            return 0.0
+        return sum(info["latencies"]) / len(info["latencies"])
+
+    def _record_sample(self, worker_id):
+        info = self.workers[worker_id]
+        sample = {
+            "time": time.time(),
+            "status": info["status"],
+            "active_pages": info["active_pages"],
+            "page_limit": info["page_limit"],
+            "loop_lag": info["loop_lag"],
+            "cpu_usage": info["cpu_usage"],
+            "memory_usage": info["memory_usage"],
+            "latency": self._latency(info),
+            "error_rate": info["breaker"].error_rate,
+            "cache_hits": info["cache_hits"],
+            "cache_misses": info["cache_misses"],
+        }
+        self.history[worker_id].append(sample)
+        self.publish("sample", {"worker_id": worker_id, "sample": sample})
+
+    def start_monitor(self):
+        self._monitor_task = asyncio.create_task(self._monitor())
+
+    async def stop_monitor(self):
+        if self._monitor_task:
+            self._monitor_task.cancel()
+            try:
+                await self._monitor_task
+            except asyncio.CancelledError:
+                pass
+
+    async def _monitor(self):
+        while True:
+            await asyncio.sleep(settings.registry.monitor_interval / 1000)
+            try:
+                await self.check_workers()
+                if self.shared:
+                    await asyncio.to_thread(self.shared.sweep)
+            except Exception as e:
+                log.error(f"Error checking workers: {e}")
+
+    async def check_workers(self):
+        async with self._lock:
+            for worker_id, process_info in list(self.processes.items()):
+                process = process_info["process"]
+                if not process_info["registered"] or process_info.get(
+                    "stopping"
                 ):
-                    await self.workers[worker_id]["stub"]._channel.close()
-                del self.workers[worker_id]
+                    continue
+                if process.poll() is not None:
+                    log.error(
+                        f"Worker {worker_id} exited with code "
+                        f"{process.returncode}"
+                    )
+                    await self._remove_worker(worker_id)
+                    self._release_process(worker_id)
 
-            del self.processes[worker_id]
-            return {"worker_id": worker_id, "status": "terminated"}
+            now = datetime.now()
+            stale = timedelta(
+                milliseconds=settings.registry.heartbeat_timeout
+            )
+            for worker_id, info in list(self.workers.items()):
+                silence = now - info["last_report"]
+                if silence > stale * settings.registry.evict_after:
+                    log.error(
+                        f"Worker {worker_id} silent for {silence}, evicting"
+                    )
+                    await self._remove_worker(worker_id)
+                    if worker_id in self.processes:
+                        self.processes[worker_id]["process"].kill()
+                        self._release_process(worker_id)
+                elif silence > stale and info["status"] != "STALE":
+                    log.warning(
+                        f"Worker {worker_id} missed heartbeats for {silence}"
+                    )
+                    info["status"] = "STALE"
+                    self.publish("worker", self.describe_worker(worker_id))
 
-    async def register_worker(self, worker_id, host, port):
-        log.info(f"Worker {worker_id} registered from {host}:{port}")
-        channel = grpc.aio.insecure_channel(f"{host}:{port}")
+    async def register_worker(
+        self,
+        worker_id,
+        host,
+        port,
+        startup_time=0.0,
+        browser_launch_time=0.0,
+        address="",
+    ):
+        address = address or f"{host}:{port}"
+        log.info(
+            f"Worker {worker_id} registered from {address} "
+            f"(startup {startup_time:.2f}s, "
+            f"browser {browser_launch_time:.2f}s)"
+        )
+        spawn_duration = 0.0
+        if worker_id in self.processes:
+            spawn_duration = (
+                datetime.now() - self.processes[worker_id]["spawn_time"]
+            ).total_seconds()
+        channel = grpc.aio.insecure_channel(address, options=grpc_options())
         stub = parse_pb2_grpc.ParserWorkerStub(channel)
         self.workers[worker_id] = {
             "host": host,
             "port": port,
+            "address": address,
             "stub": stub,
             "status": "UNKNOWN",
             "last_report": datetime.now(),
             "active_pages": 0,
             "cpu_usage": 0.0,
             "memory_usage": 0.0,
+            "cache_hits": 0,
+            "cache_misses": 0,
+            "page_limit": 0,
+            "loop_lag": 0.0,
+            "breaker": CircuitBreaker(),
+            "startup_time": startup_time,
+            "browser_launch_time": browser_launch_time,
+            "spawn_duration": spawn_duration,
+            "latencies": deque(maxlen=settings.dashboard.latency_window),
+            "draining": False,
             "registered": True,
         }
+        self.history[worker_id] = deque(maxlen=settings.dashboard.history_size)
+        self.publish("worker", self.describe_worker(worker_id))
 
     async def update_worker_status(
-        self, worker_id, port, status, active_pages, cpu_usage, memory_usage
+        self,
+        worker_id,
+        port,
+        status,
+        active_pages,
+        cpu_usage,
+        memory_usage,
+        cache_hits=0,
+        cache_misses=0,
+        page_limit=0,
+        loop_lag=0.0,
     ):
         async with self._lock:
             if worker_id in self.workers:
@@ -115,13 +492,20 @@ class WorkerRegistry:
                 self.workers[worker_id]["active_pages"] = active_pages
                 self.workers[worker_id]["cpu_usage"] = cpu_usage
                 self.workers[worker_id]["memory_usage"] = memory_usage
+                self.workers[worker_id]["cache_hits"] = cache_hits
+                self.workers[worker_id]["cache_misses"] = cache_misses
+                self.workers[worker_id]["page_limit"] = page_limit
+                self.workers[worker_id]["loop_lag"] = loop_lag
+                self._record_sample(worker_id)
 
-    async def get_available_worker(self):
+    async def get_available_worker(self, exclude=()):
         async with self._lock:
             available_workers = [
                 (id, info)
                 for id, info in self.workers.items()
-                if info["status"] == parse_pb2.HealthCheckStatus.Value("OK")
+                if self._serving(info)
+                and id not in exclude
+                and info["breaker"].allow()
             ]
 
             if not available_workers:
@@ -129,7 +513,88 @@ class WorkerRegistry:
 
             worker_id, info = min(
                 available_workers,
-                key=lambda x: (x[1]["active_pages"], x[1]["cpu_usage"]),
+                key=lambda x: (self._utilization(x[1]), x[1]["cpu_usage"]),
             )
 
-            return info["stub"]
+            info["breaker"].on_dispatch()
+            return worker_id, info["stub"]
+
+    # Share of the worker's adaptive page limit in use, so workers that
+    # have found room for more pages get more of them
+    def _utilization(self, info):
+        if not info["page_limit"]:
+            return info["active_pages"]
+        return info["active_pages"] / info["page_limit"]
+
+    def _serving(self, info):
+        return (
+            info["status"] == parse_pb2.HealthCheckStatus.Value("OK")
+            and not info["draining"]
+        )
+
+    def capacity(self):
+        return sum(1 for info in self.workers.values() if self._serving(info))
+
+    async def _wait_serving(self, worker_id):
+        for _ in range(settings.spawn.register_timeout // 100):
+            info = self.workers.get(worker_id)
+            if info and self._serving(info):
+                return
+            await asyncio.sleep(0.1)
+        raise RuntimeError(f"Worker {worker_id} did not become healthy")
+
+    # Replaces every worker one at a time. While serving capacity is above
+    # the floor a worker is drained before its replacement starts,
+    # otherwise the replacement is started first
+    async def rolling_restart(self, floor=None):
+        if self._restarting:
+            raise RuntimeError("Rolling restart already in progress")
+
+        old = [
+            worker_id
+            for worker_id, info in self.processes.items()
+            if info["registered"]
+        ]
+        floor = floor if floor is not None else settings.registry.restart_floor
+        floor = min(floor or len(old), len(old))
+        log.info(
+            f"Rolling restart of {len(old)} workers, "
+            f"keeping at least {floor} serving"
+        )
+
+        self._restarting = True
+        replaced = []
+        try:
+            for worker_id in old:
+                if worker_id not in self.processes:
+                    continue
+                if self.capacity() - 1 < floor:
+                    spawned = await self.spawn_worker()
+                    await self._wait_serving(spawned["worker_id"])
+                    await self.kill_worker(worker_id)
+                else:
+                    await self.kill_worker(worker_id)
+                    spawned = await self.spawn_worker()
+                    await self._wait_serving(spawned["worker_id"])
+                replaced.append(
+                    {"old": worker_id, "new": spawned["worker_id"]}
+                )
+        finally:
+            self._restarting = False
+
+        log.info(f"Rolling restart replaced {len(replaced)} workers")
+        return {"replaced": replaced}
+
+    async def record_result(self, worker_id, ok, latency=None):
+        if worker_id not in self.workers:
+            return
+        if latency is not None:
+            self.workers[worker_id]["latencies"].append(latency)
+        breaker = self.workers[worker_id]["breaker"]
+        previous = breaker.state
+        breaker.record(ok)
+        if breaker.state != previous:
+            log.warning(
+                f"Worker {worker_id} circuit {previous} -> {breaker.state} "
+                f"(error rate {breaker.error_rate:.0%})"
+            )
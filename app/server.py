@@ -1,15 +1,24 @@
+import asyncio
+import base64
+import json
+import uuid
 from contextlib import asynccontextmanager
-from typing import Optional
+from typing import Any, Literal, Optional
 
+import grpc
 import uvicorn
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 import app.generated.parse_pb2 as parse_pb2
 
 from app.config import settings
+from app.diagnostics import ACTIONS, LoopMonitor, diagnose
+from app.dispatcher import Dispatcher
+from app.grpc.readiness import STRATEGIES
+from app.grpc.sink import SINKS
 from app.logger import log, setup_logger
 from app.manager import start_manager_server
 from app.registry import WorkerRegistry
@@ -17,26 +26,37 @@ from app.registry import WorkerRegistry
 setup_logger()
 
 worker_registry: Optional[WorkerRegistry] = None
+dispatcher: Optional[Dispatcher] = None
+loop_monitor = LoopMonitor()
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global worker_registry
+    global worker_registry, dispatcher
 
     server, worker_registry = await start_manager_server(
         settings.server.manager_address
     )
+    dispatcher = Dispatcher(worker_registry)
+    loop_monitor.start()
     yield
 
     log.info("Shutting down all workers")
     worker_ids = list(worker_registry.processes.keys())
-    for worker_id in worker_ids:
-        try:
-            await worker_registry.kill_worker(worker_id)
-        except Exception as e:
-            log.error(f"Error shutting down worker {worker_id}: {e}")
+    # Drain the whole fleet at once so shutdown takes one drain timeout
+    results = await asyncio.gather(
+        *(worker_registry.kill_worker(worker_id) for worker_id in worker_ids),
+        return_exceptions=True,
+    )
+    for worker_id, result in zip(worker_ids, results):
+        if isinstance(result, Exception):
+            log.error(f"Error shutting down worker {worker_id}: {result}")
 
+    await worker_registry.stop_monitor()
+    await worker_registry.stop_prewarm()
+    await loop_monitor.stop()
     await server.stop(grace=5)
+    worker_registry.close_transport()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -55,6 +75,29 @@ class Action(BaseModel):
     args: Optional[list[ActionArgument]] = []
 
 
+class Readiness(BaseModel):
+    strategy: Optional[Literal[STRATEGIES]] = None
+    selector: Optional[str] = None
+    text: Optional[str] = None
+    ignore_hosts: Optional[list[str]] = []
+    quiet: Optional[int] = None
+    cap: Optional[int] = None
+
+
+class Artifacts(BaseModel):
+    screenshot: Optional[bool] = False
+    full_page: Optional[bool] = False
+    selector: Optional[str] = None
+    pdf: Optional[bool] = False
+    har: Optional[bool] = False
+
+
+class Fingerprint(BaseModel):
+    hash: Optional[str] = None
+    # Hex encoded 64-bit simhash
+    simhash: Optional[str] = Field(None, pattern=r"^[0-9a-fA-F]{1,16}$")
+
+
 class ParseRequest(BaseModel):
     url: str
     proxy: Optional[str] = None
@@ -63,6 +106,16 @@ class ParseRequest(BaseModel):
     headers: Optional[dict[str, str]] = {}
     load: Optional[str] = "networkidle"
     block: Optional[list] = []
+    session: Optional[str] = None
+    mode: Optional[Literal["browser", "http", "auto"]] = "browser"
+    ready: Optional[Readiness] = None
+    script: Optional[list[dict]] = None
+    artifacts: Optional[Artifacts] = None
+    sink: Optional[Literal[SINKS]] = None
+    fingerprint: Optional[bool] = False
+    previous: Optional[Fingerprint] = None
+    simhash: Optional[bool] = False
+    ignore: Optional[list[str]] = []
 
 
 class ParseResponse(BaseModel):
@@ -72,6 +125,55 @@ class ParseResponse(BaseModel):
     headers: dict[str, str]
     cookies: list[dict]
     url: str
+    partial: bool = False
+    timings: list[dict] = []
+    script_result: Any = None
+    # Base64 encoded, only used when the client can't take multipart/mixed
+    screenshot: Optional[str] = None
+    pdf: Optional[str] = None
+    har: Optional[str] = None
+    # Where the result was written when the request named a sink
+    reference: Optional[dict] = None
+    fingerprint: Optional[Fingerprint] = None
+    unchanged: bool = False
+
+
+ARTIFACT_TYPES = {
+    "screenshot": ("image/png", "screenshot.png"),
+    "pdf": ("application/pdf", "page.pdf"),
+    "har": ("application/json", "network.har"),
+}
+
+
+def multipart_response(
+    response: ParseResponse, artifacts: dict[str, bytes]
+) -> StreamingResponse:
+    # The JSON part goes first, artifacts follow as raw binary parts so
+    # they are neither base64 inflated nor joined into one buffer
+    boundary = uuid.uuid4().hex
+
+    def parts():
+        yield (
+            f"--{boundary}\r\n"
+            "Content-Type: application/json\r\n"
+            'Content-Disposition: inline; name="response"\r\n\r\n'
+        ).encode()
+        yield response.model_dump_json().encode()
+        for name, body in artifacts.items():
+            content_type, filename = ARTIFACT_TYPES[name]
+            yield (
+                f"\r\n--{boundary}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f'Content-Disposition: attachment; name="{name}"; '
+                f'filename="{filename}"\r\n'
+                f"Content-Length: {len(body)}\r\n\r\n"
+            ).encode()
+            yield body
+        yield f"\r\n--{boundary}--\r\n".encode()
+
+    return StreamingResponse(
+        parts(), media_type=f"multipart/mixed; boundary={boundary}"
+    )
 
 
 @app.get("/")
@@ -83,52 +185,168 @@ async def get_dashboard():
 async def spawn_worker():
     try:
         result = await worker_registry.spawn_worker()
+        location = result["socket"] or f"port {result['port']}"
         return {
-            "message": f"Worker {result['worker_id']} spawned on port {result['port']}"
+            "message": f"Worker {result['worker_id']} spawned on {location}"
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.delete("/worker/{worker_id}")
-async def kill_worker(worker_id: str):
+async def kill_worker(worker_id: str, drain: bool = True):
+    try:
+        return await worker_registry.kill_worker(worker_id, drain)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Worker not found")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/worker/{worker_id}/drain")
+async def drain_worker(worker_id: str, timeout: Optional[int] = None):
     try:
-        return await worker_registry.kill_worker(worker_id)
+        return await worker_registry.drain_worker(worker_id, timeout)
     except KeyError:
         raise HTTPException(status_code=404, detail="Worker not found")
+
+
+@app.post("/workers/restart")
+async def restart_workers(floor: Optional[int] = None):
+    try:
+        return await worker_registry.rolling_restart(floor)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/workers")
 async def list_workers():
-    workers_list = []
-    for worker_id, info in worker_registry.workers.items():
-        workers_list.append(
-            {
-                "id": worker_id,
-                "host": info["host"],
-                "port": info["port"],
-                "status": info["status"],
-                "last_report": info["last_report"].isoformat(),
-                "active_pages": info["active_pages"],
-                "cpu_usage": info["cpu_usage"],
-                "memory_usage": info["memory_usage"],
-            }
-        )
+    workers_list = [
+        worker_registry.describe_worker(worker_id)
+        for worker_id in list(worker_registry.workers)
+    ]
     return {"workers": workers_list}
 
 
-@app.post("/parse")
-async def parse(request: ParseRequest) -> ParseResponse:
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.get("/workers/stream")
+async def stream_workers():
+    queue = worker_registry.subscribe()
+    history = worker_registry.history
+
+    async def events():
+        try:
+            yield sse_event(
+                "snapshot",
+                {
+                    "workers": [
+                        worker_registry.describe_worker(worker_id)
+                        for worker_id in list(worker_registry.workers)
+                    ],
+                    "history": {
+                        worker_id: list(samples)
+                        for worker_id, samples in history.items()
+                    },
+                    "history_size": settings.dashboard.history_size,
+                },
+            )
+            while worker_registry.is_subscribed(queue):
+                try:
+                    event, data = await asyncio.wait_for(
+                        queue.get(),
+                        timeout=settings.dashboard.keepalive / 1000,
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield sse_event(event, data)
+        finally:
+            worker_registry.unsubscribe(queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+def diagnostics_file(name: str, action: str, data: bytes) -> Response:
+    extension = "folded" if action == "profile" else "txt"
+    return Response(
+        content=data,
+        media_type="text/plain",
+        headers={
+            "Content-Disposition": (
+                f'attachment; filename="{name}-{action}.{extension}"'
+            )
+        },
+    )
+
+
+@app.get("/diagnostics")
+async def get_diagnostics():
+    return {
+        "manager": loop_monitor.describe(),
+        "workers": {
+            worker_id: {"loop_lag": info["loop_lag"]}
+            for worker_id, info in list(worker_registry.workers.items())
+        },
+    }
+
+
+@app.get("/diagnostics/{action}")
+async def diagnose_manager(action: str, duration: Optional[int] = None):
+    if action not in ACTIONS:
+        raise HTTPException(status_code=404, detail="Unknown action")
+    data = await diagnose(action, duration)
+    return diagnostics_file("manager", action, data.encode())
+
+
+@app.get("/worker/{worker_id}/diagnostics/{action}")
+async def diagnose_worker(
+    worker_id: str, action: str, duration: Optional[int] = None
+):
+    if action not in ACTIONS:
+        raise HTTPException(status_code=404, detail="Unknown action")
     try:
-        stub = await worker_registry.get_available_worker()
-        log.info(f"Sending parse request to worker {stub}")
-        grpc_request = parse_pb2.ParseRequest(
-            **request.model_dump(exclude_defaults=True)
+        data = await worker_registry.diagnose_worker(
+            worker_id, action, duration
+        )
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Worker not found")
+    except grpc.aio.AioRpcError as e:
+        raise HTTPException(status_code=503, detail=e.details())
+    return diagnostics_file(worker_id, action, data)
+
+
+@app.post("/parse")
+async def parse(
+    request: ParseRequest, accept: Optional[str] = Header(None)
+) -> ParseResponse:
+    # Only a browser can run actions or capture artifacts
+    wanted = request.artifacts
+    if request.mode == "http" and (
+        request.actions
+        or request.script
+        or (wanted and (wanted.screenshot or wanted.pdf or wanted.har))
+    ):
+        raise HTTPException(
+            status_code=400,
+            detail="Actions, scripts and artifacts require browser mode",
         )
 
-        grpc_response = await stub.Parse(grpc_request)
+    try:
+        data = request.model_dump(exclude_defaults=True)
+        if "script" in data:
+            data["script"] = json.dumps(data["script"])
+        if data.get("previous", {}).get("simhash"):
+            data["previous"]["simhash"] = int(data["previous"]["simhash"], 16)
+        grpc_request = parse_pb2.ParseRequest(**data)
+
+        grpc_response = await dispatcher.parse(grpc_request)
         cookies = [
             {
                 "name": cookie.name,
@@ -142,17 +360,73 @@ async def parse(request: ParseRequest) -> ParseResponse:
             }
             for cookie in grpc_response.cookies
         ]
-        return ParseResponse(
+        response = ParseResponse(
             url=grpc_response.url,
             status=grpc_response.status,
             content=grpc_response.content,
             headers=grpc_response.headers,
             cookies=cookies,
             error=grpc_response.error,
+            partial=grpc_response.partial,
+            timings=[
+                {
+                    "path": timing.path,
+                    "op": timing.op,
+                    "duration": timing.duration,
+                    "error": timing.error,
+                }
+                for timing in grpc_response.timings
+            ],
+            script_result=(
+                json.loads(grpc_response.script_result)
+                if grpc_response.script_result
+                else None
+            ),
+            reference=(
+                {
+                    "sink": grpc_response.reference.sink,
+                    "path": grpc_response.reference.path,
+                    "offset": grpc_response.reference.offset,
+                    "length": grpc_response.reference.length,
+                    "sha256": grpc_response.reference.sha256,
+                }
+                if grpc_response.HasField("reference")
+                else None
+            ),
+            fingerprint=(
+                Fingerprint(
+                    hash=grpc_response.fingerprint.hash,
+                    simhash=(
+                        f"{grpc_response.fingerprint.simhash:016x}"
+                        if grpc_response.fingerprint.simhash
+                        else None
+                    ),
+                )
+                if grpc_response.HasField("fingerprint")
+                else None
+            ),
+            unchanged=grpc_response.unchanged,
         )
 
+        artifacts = {
+            name: getattr(grpc_response, name) for name in ARTIFACT_TYPES
+        }
+        artifacts = {name: body for name, body in artifacts.items() if body}
+        if artifacts and accept and "multipart/mixed" in accept:
+            return multipart_response(response, artifacts)
+
+        for name, body in artifacts.items():
+            setattr(response, name, base64.b64encode(body).decode())
+        return response
+
     except RuntimeError as e:
         raise HTTPException(status_code=503, detail=str(e))
+    except grpc.aio.AioRpcError as e:
+        log.error(f"Error parsing URL {request.url}: {e.details()}")
+        status_code = (
+            504 if e.code() == grpc.StatusCode.DEADLINE_EXCEEDED else 503
+        )
+        raise HTTPException(status_code=status_code, detail=e.details())
     except Exception as e:
         log.error(f"Error parsing URL {request.url}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -4,9 +4,19 @@ createApp({
   data() {
     return {
       workers: [],
+      history: {},
       loading: true,
       isSpawning: false,
-      refreshInterval: null,
+      isRestarting: false,
+      eventSource: null,
+      historySize: 360,
+      charts: [
+        { metric: "cpu_usage", label: "CPU", max: 100, color: "#2ecc71" },
+        { metric: "memory_usage", label: "Memory", max: 100, color: "#3498db" },
+        { metric: "active_pages", label: "Pages", max: 0, color: "#9b59b6" },
+        { metric: "latency", label: "Latency", max: 0, color: "#f39c12" },
+        { metric: "error_rate", label: "Errors", max: 1, color: "#e74c3c" },
+      ],
     };
   },
   computed: {
@@ -25,24 +35,49 @@ createApp({
     },
   },
   mounted() {
-    this.fetchWorkers();
-    // Refresh workers data every 5 seconds
-    this.refreshInterval = setInterval(() => {
-      this.fetchWorkers();
-    }, 5000);
+    this.connect();
   },
   beforeUnmount() {
-    clearInterval(this.refreshInterval);
+    this.eventSource.close();
   },
   methods: {
-    async fetchWorkers() {
-      try {
-        const response = await axios.get("/workers");
-        this.workers = response.data.workers;
+    connect() {
+      // The manager pushes a snapshot on connect and deltas afterwards,
+      // EventSource reconnects on its own and gets a fresh snapshot
+      this.eventSource = new EventSource("/workers/stream");
+      this.eventSource.addEventListener("snapshot", (e) => {
+        const data = JSON.parse(e.data);
+        this.workers = data.workers;
+        this.history = data.history;
+        this.historySize = data.history_size;
         this.loading = false;
-      } catch (error) {
-        console.error("Error fetching workers:", error);
-      }
+      });
+      this.eventSource.addEventListener("worker", (e) => {
+        const worker = JSON.parse(e.data);
+        const index = this.workers.findIndex((w) => w.id === worker.id);
+        if (index === -1) {
+          this.workers.push(worker);
+          this.history[worker.id] = [];
+        } else {
+          this.workers[index] = worker;
+        }
+      });
+      this.eventSource.addEventListener("sample", (e) => {
+        const { worker_id, sample } = JSON.parse(e.data);
+        const worker = this.workers.find((w) => w.id === worker_id);
+        if (!worker) return;
+        Object.assign(worker, sample, {
+          last_report: new Date(sample.time * 1000).toISOString(),
+        });
+        const samples = this.history[worker_id] || (this.history[worker_id] = []);
+        samples.push(sample);
+        if (samples.length > this.historySize) samples.shift();
+      });
+      this.eventSource.addEventListener("removed", (e) => {
+        const { worker_id } = JSON.parse(e.data);
+        this.workers = this.workers.filter((w) => w.id !== worker_id);
+        delete this.history[worker_id];
+      });
     },
     async spawnWorker() {
       if (this.isSpawning) return;
@@ -50,7 +85,6 @@ createApp({
       this.isSpawning = true;
       try {
         await axios.post("/spawn");
-        await this.fetchWorkers();
       } catch (error) {
         console.error("Error spawning worker:", error);
         alert("Failed to spawn worker: " + (error.response?.data?.detail || error.message));
@@ -58,6 +92,21 @@ createApp({
         this.isSpawning = false;
       }
     },
+    async restartWorkers() {
+      if (!confirm("Replace every worker one at a time?")) {
+        return;
+      }
+
+      this.isRestarting = true;
+      try {
+        await axios.post("/workers/restart");
+      } catch (error) {
+        console.error("Error restarting workers:", error);
+        alert("Failed to restart workers: " + (error.response?.data?.detail || error.message));
+      } finally {
+        this.isRestarting = false;
+      }
+    },
     async terminateWorker(workerId) {
       if (!confirm(`Are you sure you want to terminate worker ${workerId}?`)) {
         return;
@@ -65,7 +114,6 @@ createApp({
 
       try {
         await axios.delete(`/worker/${workerId}`);
-        await this.fetchWorkers();
       } catch (error) {
         console.error("Error terminating worker:", error);
         alert("Failed to terminate worker: " + (error.response?.data?.detail || error.message));
@@ -109,6 +157,21 @@ createApp({
       if (value < 80) return "#f39c12";
       return "#e74c3c";
     },
+    sparkline(workerId, metric, max) {
+      const samples = this.history[workerId] || [];
+      if (samples.length < 2) return "";
+      const values = samples.map((s) => s[metric]);
+      const top = max || Math.max(...values, 1);
+      const step = 100 / (samples.length - 1);
+      return values
+        .map((v, i) => `${(i * step).toFixed(1)},${(30 - (v / top) * 30).toFixed(1)}`)
+        .join(" ");
+    },
+    getCacheHitRate(worker) {
+      const total = worker.cache_hits + worker.cache_misses;
+      if (total === 0) return "—";
+      return ((worker.cache_hits / total) * 100).toFixed(1) + "%";
+    },
     formatDate(dateStr) {
       const date = new Date(dateStr);
       return new Intl.DateTimeFormat("default", {
@@ -0,0 +1,111 @@
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+
+import app.generated.parse_pb2 as parse_pb2
+
+from app.config import settings
+from app.logger import log
+
+SHARED_FIELDS = ("content", "screenshot", "pdf", "har")
+
+
+# Sockets of one manager and its workers live in a directory named after
+# the manager's pid, so several managers can share a host
+class SocketDirectory:
+    def __init__(self, path: str = settings.transport.socket_dir) -> None:
+        self.path = Path(path) / str(os.getpid())
+
+    def allocate(self, name: str) -> str:
+        self.path.mkdir(parents=True, exist_ok=True)
+        path = self.path / f"{name}.sock"
+        # Left behind by a worker that didn't shut down cleanly
+        path.unlink(missing_ok=True)
+        return str(path)
+
+    def release(self, path: str) -> None:
+        Path(path).unlink(missing_ok=True)
+
+    def close(self) -> None:
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+# Shared payloads of one manager's workers live in a directory named
+# after the manager's pid too, so a manager only sweeps its own
+class SharedDirectory:
+    def __init__(self, path: str = settings.transport.shm_dir) -> None:
+        self.path = Path(path) / str(os.getpid())
+
+    # Removes payloads nobody collected, e.g. from cancelled hedged
+    # requests
+    def sweep(self) -> None:
+        if not self.path.exists():
+            return
+
+        expired = time.time() - settings.transport.shm_ttl / 1000
+        removed = 0
+        for path in self.path.iterdir():
+            try:
+                if path.stat().st_mtime < expired:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                continue
+        if removed:
+            log.info(f"Removed {removed} uncollected shared payloads")
+
+    def close(self) -> None:
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def _unlink_shared(response: parse_pb2.ParseResponse) -> None:
+    for shared in response.shared:
+        Path(shared.path).unlink(missing_ok=True)
+
+
+# Moves large payloads into files on tmpfs and leaves references in the
+# response, so they skip protobuf encoding and the socket
+def write_shared(
+    response: parse_pb2.ParseResponse, worker_id: str, directory: str
+) -> parse_pb2.ParseResponse:
+    try:
+        for name in SHARED_FIELDS:
+            value = getattr(response, name)
+            data = value.encode() if isinstance(value, str) else value
+            if len(data) < settings.transport.shm_threshold:
+                continue
+
+            Path(directory).mkdir(parents=True, exist_ok=True)
+            path = Path(directory) / f"{worker_id}-{uuid.uuid4().hex}.{name}"
+            path.write_bytes(data)
+            response.ClearField(name)
+            response.shared.add(field=name, path=str(path), length=len(data))
+    except Exception:
+        _unlink_shared(response)
+        raise
+    return response
+
+
+def read_shared(
+    response: parse_pb2.ParseResponse,
+) -> parse_pb2.ParseResponse:
+    try:
+        for shared in response.shared:
+            data = Path(shared.path).read_bytes()
+            if len(data) != shared.length:
+                raise RuntimeError(
+                    f"Shared {shared.field} is {len(data)} bytes, "
+                    f"expected {shared.length}"
+                )
+            setattr(
+                response,
+                shared.field,
+                data.decode() if shared.field == "content" else data,
+            )
+    finally:
+        # Read or not, nobody else will collect them
+        _unlink_shared(response)
+    response.ClearField("shared")
+    return response